@@ -0,0 +1,224 @@
+"""语法高亮器基准测试
+
+在Qt offscreen平台下，用生成的语料驱动 HTMLHighlighter、CSSHighlighter 和 JavaScriptHighlighter，
+输出每秒高亮行数、内存峰值和增量编辑的重新高亮耗时（JSON格式），便于在各版本之间比较。
+高亮格式保存在Qt一侧，因此内存按进程常驻内存的峰值统计；各用例按语料从小到大执行，
+peak_rss_growth_kb 是该用例使峰值增长的部分。
+
+    python benchmark_highlighters.py --sizes 1000 10000 100000 --output result.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，此时不报告进程内存峰值
+    resource = None
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import QT_VERSION_STR
+from PyQt5.QtWidgets import QApplication, QPlainTextDocumentLayout
+from PyQt5.QtGui import QTextDocument, QTextCursor
+
+import web_editor
+from web_editor import HTMLHighlighter, CSSHighlighter, JavaScriptHighlighter
+
+HIGHLIGHTERS = {
+    'html': HTMLHighlighter,
+    'css': CSSHighlighter,
+    'js': JavaScriptHighlighter,
+}
+
+# 各语言的语料行模板：普通代码、注释密集；深层嵌套和长行由普通模板变换得到
+LINE_TEMPLATES = {
+    'html': {
+        'mixed': [
+            '<div class="card" id="item-{n}">',
+            '<h2 title=\'标题\'>Item {n}</h2>',
+            '<p>Some <span class="tag">text</span> with <a href="#{n}">link</a></p>',
+            '<img src="img/{n}.png" alt="pic">',
+            '</div>',
+        ],
+        'comments': [
+            '<!-- section {n} -->',
+            '<!-- multi-line comment',
+            '     continues here {n}',
+            '-->',
+            '<p>{n}</p>',
+        ],
+        'embedded': [
+            '<style>',
+            '.item-{n} {{ color: #ff0000; margin: {n}px; }} /* note */',
+            '</style>',
+            '<script>',
+            'const v{n} = `tpl ${{{n}}}`; function f{n}(a) {{ return a + {n}; }}',
+            '</script>',
+        ],
+    },
+    'css': {
+        'mixed': [
+            '.item-{n} {{',
+            '    color: #3a3a3a;',
+            '    margin: {n}px 10px;',
+            '    font-family: "Helvetica Neue", sans-serif;',
+            '}}',
+        ],
+        'comments': [
+            '/* block {n}',
+            '   spanning several lines',
+            '*/',
+            '/* single {n} */ .a{n} {{ width: 100%; }}',
+        ],
+    },
+    'js': {
+        'mixed': [
+            'function handler{n}(event) {{',
+            '    const value = event.target.value + "{n}";',
+            "    if (value.length > {n}) {{ return 'long'; }}",
+            '    return `value: ${{value}}`;',
+            '}}',
+        ],
+        'comments': [
+            '// line comment {n}',
+            '/* block comment {n}',
+            ' * more text',
+            ' */',
+            'let x{n} = {n}; // trailing',
+        ],
+        'templates': [
+            'const html{n} = `',
+            '    <div class="{n}">${{name}}</div>',
+            '`;',
+        ],
+    },
+}
+
+NESTING_DEPTH = 40  # 深层嵌套语料的最大缩进层数
+LONG_LINE_REPEAT = 40  # 长行语料中每行由多少个普通行拼成，总代码量与同规模的其他语料相当
+EDIT_SAMPLES = 50  # 增量编辑取样次数
+CASCADE_SAMPLES = 5  # 打开注释会重新高亮后半个文档，取样次数少一些
+
+
+def generate_corpus(language, kind, line_count):
+    """生成指定规模的语料；kind 为模板名，或 nested / long_lines"""
+    templates = LINE_TEMPLATES[language]
+    if kind == 'long_lines':
+        line_count = max(line_count // LONG_LINE_REPEAT, 1)
+    base = templates['mixed'] if kind in ('nested', 'long_lines') else templates[kind]
+    lines = []
+    n = 0
+    while len(lines) < line_count:
+        for template in base:
+            line = template.format(n=n)
+            if kind == 'nested':
+                line = '    ' * (n % NESTING_DEPTH) + line
+            elif kind == 'long_lines':
+                line = ' '.join(t.format(n=n) for t in base) * (LONG_LINE_REPEAT // len(base))
+            lines.append(line)
+            n += 1
+    return '\n'.join(lines[:line_count])
+
+
+def corpus_kinds(language):
+    return [kind for kind in LINE_TEMPLATES[language]] + ['nested', 'long_lines']
+
+
+def make_document(text):
+    # 使用纯文本布局，和编辑器一样在内容变化时触发增量高亮
+    document = QTextDocument()
+    document.setDocumentLayout(QPlainTextDocumentLayout(document))
+    document.setPlainText(text)
+    return document
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak  # macOS 以字节为单位
+
+
+def time_edits(document, position, insert_text, samples):
+    """在同一位置反复插入再删除文本，返回平均每次编辑（含重新高亮）的毫秒数"""
+    cursor = QTextCursor(document)
+    elapsed = 0.0
+    for _ in range(samples):
+        cursor.setPosition(position)
+        started = time.perf_counter()
+        cursor.insertText(insert_text)
+        cursor.setPosition(position)
+        cursor.setPosition(position + len(insert_text), QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+        elapsed += time.perf_counter() - started
+    return elapsed / samples * 1000
+
+
+def run_case(language, kind, line_count):
+    text = generate_corpus(language, kind, line_count)
+    document = make_document(text)
+
+    rss_before = peak_rss_kb()
+    started = time.perf_counter()
+    highlighter = HIGHLIGHTERS[language](document)
+    highlighter.lazy_threshold = sys.maxsize  # 测量完整高亮，不走大文档延迟模式
+    highlighter.rehighlight()
+    full_seconds = time.perf_counter() - started
+    rss_after = peak_rss_kb()
+
+    # 增量编辑：普通字符只影响当前块；打开注释会让后续块的状态改变
+    middle = document.findBlockByNumber(document.blockCount() // 2).position()
+    comment_open = '<!--' if language == 'html' else '/*'
+    return {
+        'language': language,
+        'corpus': kind,
+        'lines': document.blockCount(),
+        'characters': len(text),
+        'full_ms': round(full_seconds * 1000, 2),
+        'lines_per_second': round(document.blockCount() / full_seconds) if full_seconds else None,
+        'peak_rss_kb': rss_after,
+        'peak_rss_growth_kb': None if rss_after is None else rss_after - rss_before,
+        'edit_ms': round(time_edits(document, middle, 'x', EDIT_SAMPLES), 3),
+        'comment_toggle_ms': round(time_edits(document, middle, comment_open, CASCADE_SAMPLES), 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='语法高亮器基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='语料行数')
+    parser.add_argument('--languages', nargs='+', choices=sorted(HIGHLIGHTERS),
+                        default=sorted(HIGHLIGHTERS))
+    parser.add_argument('--output', help='结果文件路径，默认输出到标准输出')
+    args = parser.parse_args(argv)
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    results = []
+    for language in args.languages:
+        for kind in corpus_kinds(language):
+            for size in args.sizes:
+                results.append(run_case(language, kind, size))
+                print(f'{language:4} {kind:10} {size:>7} 行  完成', file=sys.stderr)
+
+    report = {
+        'tool_version': web_editor.VERSION,
+        'qt_version': QT_VERSION_STR,
+        'python_version': platform.python_version(),
+        'platform': app.platformName(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
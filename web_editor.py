@@ -1,22 +1,250 @@
 import sys
 import os
 import re
+import json
+import hashlib
+import mimetypes
+import threading
+import time
+import io
+import mmap
+import tempfile
+import shutil
+from array import array
+import csv
+import codecs
+import weakref
+import functools
+from collections import deque
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QTabWidget, QWidget, QVBoxLayout, 
                             QHBoxLayout, QTextEdit, QSplitter, QPushButton, QFileDialog, 
                             QAction, QToolBar, QMessageBox, QLabel, QStatusBar, 
                             QListWidget, QListWidgetItem, QTreeWidget, QTreeWidgetItem,
                             QComboBox, QLineEdit, QColorDialog, QMenu, QInputDialog, 
                             QFormLayout, QGridLayout, QCheckBox, QSlider, QGroupBox, 
-                            QSpinBox, QDoubleSpinBox, QFrame, QDialog, QAbstractItemDelegate)
-from PyQt5.QtCore import Qt, QUrl, QMimeData, QPoint, QSize
-from PyQt5.QtWebEngineWidgets import QWebEngineView
+                            QSpinBox, QDoubleSpinBox, QFrame, QDialog, QAbstractItemDelegate,
+                            QDockWidget, QTableWidget, QTableWidgetItem, QHeaderView,
+                            QStackedWidget, QScrollArea, QPlainTextEdit, QProgressBar, QListView)
+from PyQt5.QtCore import (Qt, QUrl, QMimeData, QPoint, QSize, QObject, QTimer, pyqtSignal,
+                          QBuffer, QIODevice, QRunnable, QThreadPool, QRect,
+                          QAbstractListModel, QModelIndex, QEvent)
+from PyQt5 import sip
+from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEnginePage, QWebEngineProfile
+from PyQt5.QtWebEngineCore import QWebEngineUrlScheme, QWebEngineUrlSchemeHandler, QWebEngineUrlRequestJob
 from PyQt5.QtGui import (QIcon, QColor, QFont, QTextCursor, QSyntaxHighlighter, 
                          QTextCharFormat, QDrag, QPainter, QBrush, QPen, QCursor, 
-                         QLinearGradient, QPalette)
+                         QLinearGradient, QPalette, QTextFormat)
 
 # 版本信息
 VERSION = "v0.1.0"
 
+# 预览调度参数（毫秒）：停止输入多久后渲染，以及连续输入时最长等待多久
+PREVIEW_QUIET_MS = 300
+PREVIEW_MAX_LATENCY_MS = 1000
+
+# 预览文档通过自定义URL协议提供，避免setHtml的2MB限制和不透明源
+PREVIEW_SCHEME = b'preview'
+PREVIEW_HOST = 'project'
+PREVIEW_DOCUMENT_PATH = '/index.html'
+_preview_scheme_registered = False
+
+# 多视口预览的宽度（像素），以及编辑停止多久后刷新不可见的视口
+PREVIEW_VIEWPORT_WIDTHS = (375, 768, 1280)
+PREVIEW_VIEWPORT_IDLE_MS = 1500
+
+# 大文档延迟高亮：超过该字符数时只高亮可见区域（前后各留若干行），其余在空闲时分片完成，
+# 每片不超过一帧的时间；超长的单行只高亮开头部分
+LAZY_HIGHLIGHT_CHARS = 200000
+LAZY_HIGHLIGHT_MARGIN = 50
+HIGHLIGHT_FRAME_BUDGET_MS = 12
+HIGHLIGHT_MAX_LINE = 20000
+
+# 热重载脚本：替换预览页中受管<style>元素的内容，不重新加载页面
+HOT_CSS_SCRIPT = """(function (css) {
+    var style = document.getElementById('__live_preview_css__');
+    if (!style) {
+        style = document.querySelector('head style') || document.head.appendChild(document.createElement('style'));
+        style.id = '__live_preview_css__';
+    }
+    style.textContent = css;
+})(%s);"""
+
+# 在新的函数作用域中重新运行JS；DOMContentLoaded已触发过，注册的回调直接执行
+HOT_JS_SCRIPT = """(function (source) {
+    var doc = new Proxy(document, {
+        get: function (target, key) {
+            if (key === 'addEventListener') {
+                return function (type, listener, options) {
+                    if (type === 'DOMContentLoaded') {
+                        listener.call(target, new Event('DOMContentLoaded'));
+                    } else {
+                        target.addEventListener(type, listener, options);
+                    }
+                };
+            }
+            var value = target[key];
+            return typeof value === 'function' ? value.bind(target) : value;
+        }
+    });
+    try {
+        new Function('document', source)(doc);
+    } catch (e) {
+        console.error(e);
+    }
+})(%s);"""
+
+# 读取导航计时：HTML解析耗时、DOMContentLoaded/load回调（用户脚本）耗时
+NAVIGATION_TIMING_SCRIPT = """(function () {
+    var t = performance.getEntriesByType('navigation')[0];
+    if (!t) {
+        return null;
+    }
+    return [Math.max(0, t.domInteractive - t.responseEnd),
+            Math.max(0, t.domContentLoadedEventEnd - t.domContentLoadedEventStart) +
+            Math.max(0, t.loadEventEnd - t.loadEventStart)];
+})();"""
+
+# DOM补丁脚本：只修改与新body不同的节点（morphdom风格）。先遍历新旧两棵树生成修改列表，确认可以补丁后
+# 再执行；新增<script>节点无法在不执行的前提下插入，遇到时不做任何修改并返回false，由调用方回退到完整加载
+DOM_PATCH_SCRIPT = """if (!window.__previewPatch) {
+    window.__previewPatch = (function () {
+        function sameKind(a, b) {
+            return a.nodeType === b.nodeType && a.nodeName === b.nodeName &&
+                (a.nodeType !== 1 || a.id === b.id);
+        }
+        function hasScript(node) {
+            return node.nodeType === 1 && (node.nodeName === 'SCRIPT' || node.querySelector('script') !== null);
+        }
+        function sameAttributes(a, b) {
+            if (a.attributes.length !== b.attributes.length) {
+                return false;
+            }
+            for (var i = 0; i < b.attributes.length; i++) {
+                if (a.getAttribute(b.attributes[i].name) !== b.attributes[i].value) {
+                    return false;
+                }
+            }
+            return true;
+        }
+        function matches(oldNode, newNode) {
+            // 已执行的脚本不能替换或重新插入：属性相同即视为同一个脚本，只更新文本
+            return oldNode.isEqualNode(newNode) || (oldNode.nodeName === 'SCRIPT' &&
+                newNode.nodeName === 'SCRIPT' && sameAttributes(oldNode, newNode));
+        }
+        function findMatch(oldChild, newChild) {
+            // 只为元素向后查找；文本和注释节点（如积木之间的换行缩进）只与当前位置比较，避免匹配到远处
+            if (newChild.nodeType !== 1) {
+                return null;
+            }
+            for (var node = oldChild; node; node = node.nextSibling) {
+                if (node.nodeType === 1 && matches(node, newChild)) {
+                    return node;
+                }
+            }
+            return null;
+        }
+        function syncAttributes(from, to) {
+            var i, attr;
+            for (i = from.attributes.length - 1; i >= 0; i--) {
+                attr = from.attributes[i];
+                if (!to.hasAttribute(attr.name)) {
+                    from.removeAttribute(attr.name);
+                }
+            }
+            for (i = 0; i < to.attributes.length; i++) {
+                attr = to.attributes[i];
+                if (from.getAttribute(attr.name) !== attr.value) {
+                    from.setAttribute(attr.name, attr.value);
+                }
+            }
+        }
+        function removeOp(parent, node) {
+            return function () { parent.removeChild(node); };
+        }
+        function insertOp(parent, node, before) {
+            return function () { parent.insertBefore(node, before); };
+        }
+        function planNode(from, to, ops) {
+            if (from.nodeType !== 1) {
+                if (from.nodeValue !== to.nodeValue) {
+                    ops.push(function () { from.nodeValue = to.nodeValue; });
+                }
+                return true;
+            }
+            if (from.isEqualNode(to)) {
+                return true;
+            }
+            ops.push(function () { syncAttributes(from, to); });
+            if (from.nodeName === 'SCRIPT') {
+                // 已执行过的脚本修改文本不会再次执行
+                if (from.textContent !== to.textContent) {
+                    ops.push(function () { from.textContent = to.textContent; });
+                }
+                return true;
+            }
+            return planChildren(from, to, ops);
+        }
+        function planChildren(from, to, ops) {
+            var oldChild = from.firstChild;
+            var newChild, match, node;
+            for (newChild = to.firstChild; newChild; newChild = newChild.nextSibling) {
+                match = findMatch(oldChild, newChild);
+                if (match) {
+                    // 跳过的旧节点是被删除的积木
+                    for (node = oldChild; node !== match; node = node.nextSibling) {
+                        ops.push(removeOp(from, node));
+                    }
+                    if (!planNode(match, newChild, ops)) {
+                        return false;
+                    }
+                    oldChild = match.nextSibling;
+                } else if (oldChild && sameKind(oldChild, newChild)) {
+                    if (!planNode(oldChild, newChild, ops)) {
+                        return false;
+                    }
+                    oldChild = oldChild.nextSibling;
+                } else if (hasScript(newChild)) {
+                    return false;
+                } else {
+                    ops.push(insertOp(from, document.importNode(newChild, true), oldChild));
+                }
+            }
+            for (node = oldChild; node; node = node.nextSibling) {
+                ops.push(removeOp(from, node));
+            }
+            return true;
+        }
+        return function (bodyMarkup) {
+            try {
+                var parsed = new DOMParser().parseFromString(
+                    '<!DOCTYPE html><html><head></head>' + bodyMarkup + '</html>', 'text/html');
+                var ops = [];
+                if (!planNode(document.body, parsed.body, ops)) {
+                    return false;
+                }
+                for (var i = 0; i < ops.length; i++) {
+                    ops[i]();
+                }
+                return true;
+            } catch (e) {
+                console.error(e);
+                return false;
+            }
+        };
+    })();
+}
+window.__previewPatch(%s);"""
+
+
+def split_page_shell(html):
+    """把HTML拆成 (body之前的部分, body标记, body之后的部分)，找不到body时返回None"""
+    body_start = html.find('<body')
+    body_end = html.rfind('</body>')
+    if body_start == -1 or body_end < body_start:
+        return None
+    body_end += len('</body>')
+    return html[:body_start], html[body_start:body_end], html[body_end:]
+
 # 定义界面颜色主题 - 现代化设计
 class Theme:
     # 主色调
@@ -68,37 +296,133 @@ class Theme:
         gradient.setColorAt(1, color2)
         return gradient
 
-# 自定义滚动区域，用于拖拽组件
-class BlockItem(QListWidgetItem):
-    def __init__(self, name, block_type, code_template, color, parameters=None, element_type=None, params=None, parent=None):
-        super().__init__(name, parent)
+# 积木生成的代码属于哪种语言：元素类型的前缀优先，其次按积木分类（面板分类和拖放颜色分类）
+BLOCK_TYPE_LANGUAGES = {
+    'motion': 'html', 'looks': 'css', 'events': 'js', 'control': 'js',
+    'html': 'html', 'css': 'css', 'js': 'js',
+    'layout': 'html', 'media': 'html', 'style': 'css', 'animation': 'css', 'event': 'js',
+}
+
+# 积木从面板拖到编辑区时携带完整信息的MIME类型，纯文本格式仅作兼容
+BLOCK_MIME_TYPE = 'application/x-scratch-web-block'
+
+def block_language(block_type, element_type=None, code=''):
+    """创建积木时确定目标语言；分类未知时才按代码内容判断一次"""
+    if element_type:
+        prefix = element_type.split('_', 1)[0]
+        if prefix in ('html', 'css', 'js'):
+            return prefix
+    language = BLOCK_TYPE_LANGUAGES.get(block_type)
+    if language is not None:
+        return language
+    if code.strip().startswith('<'):
+        return 'html'
+    if '{' in code and '}' in code:
+        return 'css'
+    return 'js'
+
+# 代码模板中的参数占位符 {{参数名}}
+TEMPLATE_PLACEHOLDER = re.compile(r'\{\{([^{}]*)\}\}')
+TEMPLATE_CACHE_SIZE = 1024  # 编译结果按模板文本缓存的数量，参数编辑器会不断生成新的模板文本
+
+# 编译后的代码模板 - 字面量和占位符交替排列，渲染时一次join；没有对应参数值的占位符原样保留
+class CompiledTemplate:
+    __slots__ = ('template', 'literals', 'names')
+    
+    def __init__(self, template):
+        self.template = template
+        self.literals = []  # 比占位符多一个：第i个占位符位于literals[i]和literals[i+1]之间
+        self.names = []
+        pos = 0
+        for match in TEMPLATE_PLACEHOLDER.finditer(template):
+            self.literals.append(template[pos:match.start()])
+            self.names.append(match.group(1))
+            pos = match.end()
+        self.literals.append(template[pos:])
+    
+    def render(self, values):
+        if not self.names:
+            return self.template
+        literals = self.literals
+        parts = [literals[0]]
+        for i, name in enumerate(self.names):
+            parts.append(str(values[name]) if name in values else '{{' + name + '}}')
+            parts.append(literals[i + 1])
+        return ''.join(parts)
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(template):
+    """解析代码模板，相同的模板文本只解析一次"""
+    return CompiledTemplate(template)
+
+def render_blocks(records):
+    """批量生成积木的代码片段并缓存在记录上；同一批中相同的模板只查找一次编译结果"""
+    compiled = {}
+    for record in records:
+        template = compiled.get(record.code_template)
+        if template is None:
+            template = compiled[record.code_template] = compile_template(record.code_template)
+        record.render_fragment(template)
+
+# 积木记录 - 积木编辑区中每个积木的数据，使用__slots__，不带控件项的开销；
+# 参数编辑器通过与积木面板项相同的属性读写。生成的代码片段缓存在记录上，修改后标记为dirty
+class BlockRecord:
+    __slots__ = ('name', 'block_type', 'code_template', 'color', 'parameters',
+                 'parameter_values', 'element_type', 'params',
+                 'language', 'fragment', 'fragment_size', 'dirty')
+    
+    def __init__(self, name, block_type, code_template, color, parameters=None, element_type=None, params=None,
+                 language=None):
+        self.name = name
         self.block_type = block_type
         self.code_template = code_template
         self.color = color
         self.parameters = parameters or []  # 参数定义列表
-        self.parameter_values = {}  # 参数值
         self.element_type = element_type  # 元素类型，用于识别专用编辑器
         self.params = params or {}  # 扩展参数字典
-        self.setSizeHint(QSize(200, 40))
+        # 目标语言在创建时确定，生成代码时直接按它分组
+        self.language = language or block_language(block_type, element_type, code_template)
         
         # 初始化参数默认值
-        for param in self.parameters:
-            self.parameter_values[param['name']] = param.get('default', '')
+        self.parameter_values = {param['name']: param.get('default', '') for param in self.parameters}
+        
+        # 代码片段在下次生成时才计算
+        self.fragment = None
+        self.fragment_size = 0
+        self.dirty = True
+    
+    def text(self):
+        """积木名称，与QListWidgetItem.text()一致"""
+        return self.name
+    
+    def copy(self):
+        """复制积木；参数定义不会被修改，可以共用，参数值和扩展参数各自独立"""
+        record = BlockRecord(self.name, self.block_type, self.code_template, self.color,
+                             self.parameters, self.element_type, dict(self.params), self.language)
+        record.parameter_values = dict(self.parameter_values)
+        return record
     
     def get_processed_code(self):
         """根据参数值处理代码模板"""
-        code = self.code_template
-        for param_name, value in self.parameter_values.items():
-            code = code.replace(f"{{{{{param_name}}}}}", str(value))
-        return code
+        return compile_template(self.code_template).render(self.parameter_values)
     
     def update_parameter(self, param_name, value):
         """更新参数值"""
         if param_name in self.parameter_values:
             self.parameter_values[param_name] = value
+            self.dirty = True
             return True
         return False
     
+    def render_fragment(self, template=None):
+        """重新生成并缓存代码片段；template 为调用方已取得的编译结果"""
+        if template is None:
+            template = compile_template(self.code_template)
+        code = template.render(self.parameter_values)
+        self.fragment = code
+        self.fragment_size = utf16_length(code)
+        self.dirty = False
+    
     def get_parameter_editor(self):
         """获取参数编辑器窗口"""
         # 根据元素类型选择合适的编辑器
@@ -110,6 +434,18 @@ class BlockItem(QListWidgetItem):
             return JSInteractionEditor(self)
         return ParameterEditor(self)
 
+# 积木面板项 - 面板中的积木模板，拖到编辑区时生成BlockRecord
+class BlockItem(QListWidgetItem):
+    def __init__(self, name, block_type, code_template, color, parameters=None, element_type=None, params=None, parent=None):
+        super().__init__(name, parent)
+        self.block_type = block_type
+        self.code_template = code_template
+        self.color = color
+        self.parameters = parameters or []  # 参数定义列表
+        self.element_type = element_type  # 元素类型，用于识别专用编辑器
+        self.params = params or {}  # 扩展参数字典
+        self.setSizeHint(QSize(200, 40))
+
 
 class HTMLElementEditor(QDialog):
     """HTML元素专用编辑器"""
@@ -902,18 +1238,6 @@ class BlockPalette(QListWidget):
     def startDrag(self, actions):
         item = self.currentItem()
         if item:
-            # 创建新的积木实例，避免修改原始模板
-            # 手动创建新实例而不是使用深拷贝，因为QListWidgetItem不可pickle
-            new_item = BlockItem(
-                name=item.text(),
-                block_type=item.block_type,
-                code_template=item.code_template,
-                color=item.color,
-                parameters=getattr(item, 'parameters', None),
-                element_type=getattr(item, 'element_type', None),
-                params=getattr(item, 'params', None)
-            )
-            
             # 将参数信息也序列化
             params_str = "|"
             if hasattr(item, 'parameters'):
@@ -923,6 +1247,16 @@ class BlockPalette(QListWidget):
             
             mime_data = QMimeData()
             mime_data.setText(f"{item.block_type}:{item.text()}:{item.code_template}{params_str}")
+            # 完整的积木信息，编辑区据此创建积木，保留元素类型和扩展参数
+            block_data = {
+                'name': item.text(),
+                'block_type': item.block_type,
+                'code_template': item.code_template,
+                'parameters': item.parameters,
+                'element_type': item.element_type,
+                'params': item.params,
+            }
+            mime_data.setData(BLOCK_MIME_TYPE, json.dumps(block_data).encode('utf-8'))
             
             drag = QDrag(self)
             drag.setMimeData(mime_data)
@@ -942,12 +1276,66 @@ class BlockPalette(QListWidget):
         # 这里可以自定义渲染，但Qt的QListWidgetItem样式有限
         # 实际渲染将在BlockEditor中实现
 
-class BlockEditor(QListWidget):
+# 积木列表模型 - 按行保存BlockRecord，视图通过BLOCK_RECORD_ROLE取记录绘制
+BLOCK_RECORD_ROLE = Qt.UserRole + 1
+
+class BlockListModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.records = []
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        record = self.records[index.row()]
+        if role == Qt.DisplayRole:
+            return record.name
+        if role == BLOCK_RECORD_ROLE:
+            return record
+        return None
+    
+    def record(self, row):
+        return self.records[row]
+    
+    def append_record(self, record):
+        row = len(self.records)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.records.append(record)
+        self.endInsertRows()
+        return row
+    
+    def remove_record(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.records[row]
+        self.endRemoveRows()
+    
+    def record_changed(self, record):
+        """参数编辑后标记积木需要重新生成代码，并通知视图重绘"""
+        record.dirty = True
+        for row in range(len(self.records)):
+            if self.records[row] is record:
+                index = self.index(row)
+                self.dataChanged.emit(index, index)
+                return
+    
+    def clear(self):
+        self.beginResetModel()
+        self.records = []
+        self.endResetModel()
+
+# 积木编辑区 - 所有积木同高，滚动、选择和拖放的开销与积木数量无关
+class BlockEditor(QListView):
     def __init__(self, main_window=None):
         super().__init__()
         self.main_window = main_window  # 保存对主窗口的引用
+        self.block_model = BlockListModel(self)
+        self.setModel(self.block_model)
+        self.setUniformItemSizes(True)
         self.setAcceptDrops(True)
-        self.setSelectionMode(QListWidget.SingleSelection)
+        self.setSelectionMode(QListView.SingleSelection)
         self.setSpacing(10)
         self.setStyleSheet("background-color: #f0f0f0; " + \
                             "color: #333333; " + \
@@ -960,6 +1348,22 @@ class BlockEditor(QListWidget):
         # 启用自定义项目绘制
         self.setItemDelegate(BlockItemDelegate())
     
+    def count(self):
+        return self.block_model.rowCount()
+    
+    def records(self):
+        return self.block_model.records
+    
+    def clear(self):
+        self.block_model.clear()
+    
+    def current_record(self):
+        index = self.currentIndex()
+        return self.block_model.record(index.row()) if index.isValid() else None
+    
+    def select_row(self, row):
+        self.setCurrentIndex(self.block_model.index(row))
+    
     def dragEnterEvent(self, event):
         if event.mimeData().hasText():
             event.acceptProposedAction()
@@ -969,9 +1373,19 @@ class BlockEditor(QListWidget):
             event.acceptProposedAction()
     
     def dropEvent(self, event):
-        if event.mimeData().hasText():
+        mime_data = event.mimeData()
+        if mime_data.hasFormat(BLOCK_MIME_TYPE):
+            # 来自积木面板：带有元素类型和扩展参数
+            block_data = json.loads(bytes(mime_data.data(BLOCK_MIME_TYPE)).decode('utf-8'))
+            block_type = block_data['block_type']
+            name = block_data['name']
+            code_template = block_data['code_template']
+            parameters = block_data.get('parameters') or []
+            element_type = block_data.get('element_type')
+            params = block_data.get('params')
+        elif mime_data.hasText():
             # 处理拖放的数据
-            data = event.mimeData().text().split("|", 1)
+            data = mime_data.text().split("|", 1)
             
             # 解析基本信息
             basic_info = data[0].split(":", 2)
@@ -980,59 +1394,62 @@ class BlockEditor(QListWidget):
                 
             block_type, name, code_template = basic_info
             parameters = []
+            element_type = params = None
             
             # 解析参数信息
             if len(data) > 1:
                 try:
-                    import json
                     parameters = json.loads(data[1])
                 except:
                     pass
-            
-            # 根据类型选择颜色 - 使用新的主题颜色
-            color_map = {
-                "html": Theme.BLOCK_HTML,
-                "css": Theme.BLOCK_CSS,
-                "js": Theme.BLOCK_JS,
-                "layout": Theme.BLOCK_LAYOUT,
-                "style": Theme.BLOCK_STYLE,
-                "event": Theme.BLOCK_EVENT,
-                "animation": Theme.BLOCK_ANIMATION,
-                "media": Theme.BLOCK_MEDIA
-            }
-            color = color_map.get(block_type, Theme.BLOCK_LAYOUT)
-            
-            # 创建新的积木项
-            item = BlockItem(name, block_type, code_template, color, parameters)
-            self.addItem(item)
-            
-            # 自动显示参数编辑窗口（如果有参数）
-            if parameters:
-                self.edit_item_parameters()
-            
-            # 更新代码
-            if self.main_window:
-                self.main_window.update_code_from_blocks()
+        else:
+            return
+        
+        # 根据类型选择颜色 - 使用新的主题颜色
+        color_map = {
+            "html": Theme.BLOCK_HTML,
+            "css": Theme.BLOCK_CSS,
+            "js": Theme.BLOCK_JS,
+            "layout": Theme.BLOCK_LAYOUT,
+            "style": Theme.BLOCK_STYLE,
+            "event": Theme.BLOCK_EVENT,
+            "animation": Theme.BLOCK_ANIMATION,
+            "media": Theme.BLOCK_MEDIA
+        }
+        color = color_map.get(block_type, Theme.BLOCK_LAYOUT)
+        
+        # 创建新的积木，目标语言在此确定
+        record = BlockRecord(name, block_type, code_template, color, parameters, element_type, params)
+        row = self.block_model.append_record(record)
+        
+        # 自动显示参数编辑窗口（如果有参数）
+        if parameters:
+            self.select_row(row)
+            self.edit_item_parameters()
+        
+        # 更新代码
+        if self.main_window:
+            self.main_window.update_code_from_blocks()
     
     def mousePressEvent(self, event):
         if event.button() == Qt.RightButton:
-            item = self.itemAt(event.pos())
-            if item:
-                self.setCurrentItem(item)
+            index = self.indexAt(event.pos())
+            if index.isValid():
+                self.setCurrentIndex(index)
                 self.show_context_menu(event.globalPos())
         elif event.button() == Qt.LeftButton and event.modifiers() == Qt.ControlModifier:
             # Ctrl+点击编辑元素
-            item = self.itemAt(event.pos())
-            if item:
-                self.setCurrentItem(item)
+            index = self.indexAt(event.pos())
+            if index.isValid():
+                self.setCurrentIndex(index)
                 self.edit_item_parameters()
         super().mousePressEvent(event)
         
     def mouseDoubleClickEvent(self, event):
         # 双击编辑元素
-        item = self.itemAt(event.pos())
-        if item:
-            self.setCurrentItem(item)
+        index = self.indexAt(event.pos())
+        if index.isValid():
+            self.setCurrentIndex(index)
             self.edit_item_parameters()
         super().mouseDoubleClickEvent(event)
     
@@ -1045,13 +1462,9 @@ class BlockEditor(QListWidget):
         delete_action = QAction("删除", self)
         delete_action.triggered.connect(self.delete_selected_item)
         
+        # 每个积木都有元素类型属性，编辑选项始终可用
         edit_action = QAction("编辑元素", self)
-        # 有参数列表或元素类型属性就启用编辑选项
-        item = self.currentItem()
-        if hasattr(item, 'parameters') and item.parameters or hasattr(item, 'element_type'):
-            edit_action.triggered.connect(self.edit_item_parameters)
-        else:
-            edit_action.setEnabled(False)
+        edit_action.triggered.connect(self.edit_item_parameters)
         
         duplicate_action = QAction("复制", self)
         duplicate_action.triggered.connect(self.duplicate_selected_item)
@@ -1063,10 +1476,10 @@ class BlockEditor(QListWidget):
         menu.exec_(pos)
     
     def delete_selected_item(self):
-        item = self.currentItem()
-        if item:
+        index = self.currentIndex()
+        if index.isValid():
             # 获取元素名称（如果有）
-            element_name = item.text()
+            element_name = self.block_model.record(index.row()).name
             # 显示删除确认对话框
             reply = QMessageBox.question(
                 self,
@@ -1078,55 +1491,42 @@ class BlockEditor(QListWidget):
 
             
             if reply == QMessageBox.Yes:
-                index = self.row(item)
-                self.takeItem(index)
+                self.block_model.remove_record(index.row())
                 if self.main_window:
                     self.main_window.update_code_from_blocks()
     
     def duplicate_selected_item(self):
-        item = self.currentItem()
-        if item:
-            import copy
-            # 创建副本
-            new_item = copy.deepcopy(item)
-            # 添加到列表
-            self.addItem(new_item)
+        record = self.current_record()
+        if record:
+            # 复制到列表末尾
+            self.block_model.append_record(record.copy())
             if self.main_window:
                 self.main_window.update_code_from_blocks()
     
     def edit_item_parameters(self):
-        item = self.currentItem()
-        if item and (hasattr(item, 'parameters') and item.parameters or hasattr(item, 'element_type')):
+        record = self.current_record()
+        if record:
             # 使用新的参数编辑器
-            editor = item.get_parameter_editor()
+            editor = record.get_parameter_editor()
             editor.setWindowModality(Qt.ApplicationModal)
             editor.show()
             
             # 连接关闭信号到代码更新
-            editor.destroyed.connect(self._on_editor_closed)
+            editor.destroyed.connect(lambda: self._on_editor_closed(record))
     
-    def _on_editor_closed(self):
-        """当参数编辑器关闭时更新代码"""
+    def _on_editor_closed(self, record):
+        """当参数编辑器关闭时重绘积木并更新代码"""
+        self.block_model.record_changed(record)
         if self.main_window:
             self.main_window.update_code_from_blocks()
 
 # 自定义积木项渲染委托
 class BlockItemDelegate(QAbstractItemDelegate):
     def paint(self, painter, option, index):
-        # 从模型中获取数据
-        # 对于QListWidget，我们可以通过直接获取QListWidgetItem来访问BlockItem
-        list_widget = option.styleObject
-        if list_widget and hasattr(list_widget, 'item'):
-            item = list_widget.item(index.row())
-            if not isinstance(item, BlockItem):
-                # 使用默认绘制
-                painter.save()
-                painter.fillRect(option.rect, option.palette.base())
-                painter.drawText(option.rect, Qt.AlignCenter, index.data(Qt.DisplayRole))
-                painter.restore()
-                return
-        else:
-            # 如果无法获取item，使用默认绘制
+        # 从模型中获取积木记录
+        item = index.data(BLOCK_RECORD_ROLE)
+        if item is None:
+            # 使用默认绘制
             painter.save()
             painter.fillRect(option.rect, option.palette.base())
             painter.drawText(option.rect, Qt.AlignCenter, index.data(Qt.DisplayRole))
@@ -1168,179 +1568,1486 @@ class BlockItemDelegate(QAbstractItemDelegate):
         # 返回默认大小
         return QSize(200, 40)
 
-class CodeEditor(QTextEdit):
+# 积木代码生成器 - 只为dirty的积木重新生成片段，并只把变化的片段范围写回编辑器。
+# HTML写在<body>内、JS写在DOMContentLoaded回调内，各片段前加一个缩进换行；CSS规则写在文档末尾，前面空一行，
+# 相同的规则只写一次。编辑器在两次生成之间被手动修改过（修订号不同）时，重新定位并整体重写生成区域
+class BlockCodeGenerator:
+    BLOCK_SEPARATOR = '\n    '
+    SEPARATORS = {'html': BLOCK_SEPARATOR, 'css': '\n\n', 'js': BLOCK_SEPARATOR}
+    JS_HANDLER = 'document.addEventListener("DOMContentLoaded", function() {'
+    
+    def __init__(self, html_editor, css_editor, js_editor):
+        self.editors = {'html': html_editor, 'css': css_editor, 'js': js_editor}
+        # 各区域上次写入的 [(积木, 片段, 片段长度)]，以及写入后编辑器的 (修订号, 区域起点)
+        self._emitted = {}
+        self._anchors = {}
+    
+    def update(self, records):
+        """生成代码并写入编辑器，返回是否有编辑器内容改变"""
+        render_blocks([record for record in records if record.dirty])
+        entries = {'html': [], 'css': [], 'js': []}
+        css_rules = set()
+        for record in records:
+            if record.language == 'css':
+                # 重复的规则记为空片段，前面相同的规则删除后它再写出
+                if record.fragment in css_rules:
+                    entries['css'].append((record, '', 0))
+                    continue
+                css_rules.add(record.fragment)
+            entries[record.language].append((record, record.fragment, record.fragment_size))
+        
+        changed = self._update_region('css', entries['css'])
+        changed = self._update_region('html', entries['html']) or changed
+        changed = self._update_region('js', entries['js']) or changed
+        return changed
+    
+    def _update_region(self, language, entries):
+        editor = self.editors[language]
+        separator = self.SEPARATORS[language]
+        anchor = self._anchors.get(language)
+        if anchor is not None and anchor[0] == editor.revision:
+            # 跳过首尾未改变的片段，只替换中间的范围
+            old = self._emitted[language]
+            limit = min(len(old), len(entries))
+            prefix = 0
+            while prefix < limit and self._same_entry(old[prefix], entries[prefix]):
+                prefix += 1
+            suffix = 0
+            while suffix < limit - prefix and self._same_entry(old[-1 - suffix], entries[-1 - suffix]):
+                suffix += 1
+            if prefix == len(old) == len(entries):
+                return False
+            start = anchor[1]
+            offset = start + self._region_length(separator, old[:prefix])
+            removed = self._region_length(separator, old[prefix:len(old) - suffix])
+            editor.replace_range(offset, offset + removed,
+                                 self._region_text(separator, entries[prefix:len(entries) - suffix]))
+        elif language == 'css':
+            region = self._locate_css_region(editor.text_snapshot(), entries)
+            if region is None:
+                return False
+            start, end = region
+            editor.replace_range(start, end, self._region_text(separator, entries))
+        else:
+            # 没有该语言的积木时保留编辑器原有内容
+            if not entries:
+                return False
+            region = self._locate_region(language, editor.text_snapshot())
+            if region is None:
+                return False
+            start, end = region
+            editor.replace_range(start, end, self._region_text(separator, entries) + '\n')
+        self._emitted[language] = entries
+        self._anchors[language] = (editor.revision, start)
+        return True
+    
+    @staticmethod
+    def _same_entry(old, new):
+        return old[0] is new[0] and (old[1] is new[1] or old[1] == new[1])
+    
+    @staticmethod
+    def _region_text(separator, entries):
+        # 空片段（重复的CSS规则）不写分隔符
+        return ''.join(separator + fragment for _, fragment, _ in entries if fragment)
+    
+    @staticmethod
+    def _region_length(separator, entries):
+        return sum(size + len(separator) for _, _, size in entries if size)
+    
+    def _locate_css_region(self, text, entries):
+        """CSS生成区域就是上次写入的规则；找不到时（如被手动改动）在文档末尾另起区域，没有规则可写时返回None"""
+        emitted = self._emitted.get('css')
+        old = self._region_text(self.SEPARATORS['css'], emitted) if emitted else ''
+        start = text.rfind(old) if old else -1
+        if start == -1:
+            if not any(fragment for _, fragment, _ in entries):
+                return None
+            end = utf16_length(text)
+            return end, end
+        start_position = utf16_length(text[:start])
+        return start_position, start_position + utf16_length(old)
+    
+    def _locate_region(self, language, text):
+        """返回生成区域在文档中的 (起点, 终点)，按UTF-16位置计；找不到时返回None"""
+        if language == 'html':
+            start = text.find('<body>')
+            end = text.find('</body>')
+            head = len('<body>')
+        else:
+            start = text.find(self.JS_HANDLER)
+            end = text.rfind('});')
+            head = len(self.JS_HANDLER)
+        if start == -1 or end < start + head:
+            return None
+        start += head
+        if text.isascii():
+            return start, end
+        start_position = utf16_length(text[:start])
+        return start_position, start_position + utf16_length(text[start:end])
+
+def utf16_length(text):
+    # 文档位置按UTF-16计，BMP以外的字符占两个单位
+    if text.isascii():
+        return len(text)
+    return len(text.encode('utf-16-le')) // 2
+
+# 行号栏 - 绘制交给所属的代码编辑器
+class LineNumberArea(QWidget):
+    def __init__(self, editor):
+        super().__init__(editor)
+        self.editor = editor
+    
+    def sizeHint(self):
+        return QSize(self.editor.line_number_area_width(), 0)
+    
+    def paintEvent(self, event):
+        self.editor.paint_line_numbers(event)
+
+# 代码编辑器 - 基于QPlainTextEdit，按块布局，十万行的文件滚动也是常数时间
+class CodeEditor(QPlainTextEdit):
+    # 文本增量：修订号、位置、删除的字符数、插入的文本（位置和长度按文档的UTF-16单位计）
+    text_delta = pyqtSignal(int, int, int, str)
+    
     def __init__(self, language="html", parent=None):
         super().__init__(parent)
         self.language = language
+        
+        # 修订号随每次文本修改递增，全文快照按需重建，未修改的编辑器不再复制全文
+        self.revision = 0
+        self._snapshot = ''
+        self._snapshot_revision = 0
+        self._length = 0
+        self.document().contentsChange.connect(self._track_contents_change)
+        
         self.setTabStopWidth(40)
         self.setFont(QFont("Consolas", 12))
         self.setStyleSheet("background-color: #ffffff; " + \
                             "color: #333333; " + \
                             "border: 1px solid #cccccc; " + \
                             "border-radius: 6px; " + \
-                            "padding: 15px; " + \
                           "selection-background-color: " + Theme.PRIMARY_DARK.name() + "; ")
-        self.setAcceptRichText(False)
         self.setUndoRedoEnabled(True)
-        self.setLineWrapMode(QTextEdit.WidgetWidth)
-        
-        # 启用语法高亮
-        if language == "html":
-            self.highlighter = HTMLHighlighter(self.document())
-        elif language == "css":
-            self.highlighter = CSSHighlighter(self.document())
-        elif language == "js":
-            self.highlighter = JavaScriptHighlighter(self.document())
+        self.setLineWrapMode(QPlainTextEdit.NoWrap)
+        
+        # 行号栏和当前行高亮
+        self.line_number_area = LineNumberArea(self)
+        self.blockCountChanged.connect(self.update_line_number_area_width)
+        self.updateRequest.connect(self.update_line_number_area)
+        self.cursorPositionChanged.connect(self.highlight_current_line)
+        self.update_line_number_area_width()
+        self.highlight_current_line()
+        
+        # 启用语法高亮：规则和格式按语言共用
+        self.highlighter = highlighter_registry.create(language, self.document())
+        
+        # 大文档的延迟高亮：滚动或改变大小时补上可见区域，其余由空闲定时器分片处理
+        self._idle_block = 0
+        self.idle_highlight_timer = QTimer(self)
+        self.idle_highlight_timer.setInterval(0)
+        self.idle_highlight_timer.timeout.connect(self._highlight_idle_slice)
+        if self.highlighter is not None:
+            self.document().contentsChange.connect(self._on_contents_change)
+            self.verticalScrollBar().valueChanged.connect(self._highlight_visible)
+    
+    def text_snapshot(self):
+        """返回当前全文；自上次调用以来没有修改时直接返回缓存的同一个字符串"""
+        if self._snapshot_revision != self.revision:
+            self._snapshot = self.toPlainText()
+            self._snapshot_revision = self.revision
+        return self._snapshot
+    
+    def replace_range(self, start, end, text):
+        """在一个编辑块中把 [start, end)（UTF-16位置）替换为text"""
+        cursor = QTextCursor(self.document())
+        cursor.beginEditBlock()
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        cursor.insertText(text)
+        cursor.endEditBlock()
+    
+    def _track_contents_change(self, position, removed, added):
+        # setPlainText等操作报告的长度包含文档末尾的段落分隔符，按已知长度截断
+        removed = max(0, min(removed, self._length - position))
+        end = min(position + added, self.document().characterCount() - 1)
+        added = max(0, end - position)
+        if not removed and not added:
+            return
+        self.revision += 1
+        self._length += added - removed
+        # 只有存在订阅者时才取出插入的文本
+        if self.receivers(self.text_delta):
+            inserted = ''
+            if added:
+                cursor = QTextCursor(self.document())
+                cursor.setPosition(position)
+                cursor.setPosition(end, QTextCursor.KeepAnchor)
+                inserted = cursor.selectedText().replace('\u2029', '\n')
+            self.text_delta.emit(self.revision, position, removed, inserted)
+    
+    def line_number_area_width(self):
+        digits = len(str(max(1, self.blockCount())))
+        return 16 + self.fontMetrics().horizontalAdvance('9') * digits
+    
+    def update_line_number_area_width(self, _=0):
+        self.setViewportMargins(self.line_number_area_width(), 0, 0, 0)
+    
+    def update_line_number_area(self, rect, dy):
+        if dy:
+            self.line_number_area.scroll(0, dy)
+        else:
+            self.line_number_area.update(0, rect.y(), self.line_number_area.width(), rect.height())
+        if rect.contains(self.viewport().rect()):
+            self.update_line_number_area_width()
+    
+    def paint_line_numbers(self, event):
+        # 只绘制可见的块
+        painter = QPainter(self.line_number_area)
+        painter.fillRect(event.rect(), QColor('#f5f5f5'))
+        current = self.textCursor().blockNumber()
+        width = self.line_number_area.width() - 8
+        height = self.fontMetrics().height()
+        
+        block = self.firstVisibleBlock()
+        top = round(self.blockBoundingGeometry(block).translated(self.contentOffset()).top())
+        while block.isValid() and top <= event.rect().bottom():
+            bottom = top + round(self.blockBoundingRect(block).height())
+            if block.isVisible() and bottom >= event.rect().top():
+                painter.setPen(QColor('#333333') if block.blockNumber() == current else QColor('#999999'))
+                painter.drawText(0, top, width, height, Qt.AlignRight, str(block.blockNumber() + 1))
+            block = block.next()
+            top = bottom
+    
+    def highlight_current_line(self):
+        line_format = QTextCharFormat()
+        line_format.setBackground(QColor('#f0f5ff'))
+        line_format.setProperty(QTextFormat.FullWidthSelection, True)
+        cursor = self.textCursor()
+        cursor.clearSelection()
+        selection = QTextEdit.ExtraSelection()
+        selection.format = line_format
+        selection.cursor = cursor
+        self.setExtraSelections([selection])
+    
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        rect = self.contentsRect()
+        self.line_number_area.setGeometry(QRect(rect.left(), rect.top(),
+                                                self.line_number_area_width(), rect.height()))
+        if self.highlighter is not None:
+            self._highlight_visible()
+    
+    def _on_contents_change(self, position, removed, added):
+        if self.highlighter.is_highlighting():
+            return  # 高亮本身修改格式时也会发出该信号
+        if not self.highlighter.is_lazy():
+            self.idle_highlight_timer.stop()
+            return
+        block_number = self.document().findBlock(position).blockNumber()
+        if self.idle_highlight_timer.isActive():
+            self._idle_block = min(self._idle_block, block_number)
+        else:
+            self._idle_block = block_number
+            self.idle_highlight_timer.start()
+        # 文档布局更新后再计算可见区域
+        QTimer.singleShot(0, self._highlight_visible)
+    
+    def _highlight_visible(self):
+        """更新高亮器的可见范围，并立即高亮其中尚未高亮的块"""
+        if not self.highlighter.is_lazy():
+            return
+        first = self.firstVisibleBlock().blockNumber()
+        last = self.cursorForPosition(QPoint(0, self.viewport().height() - 1)).blockNumber()
+        first = max(first - LAZY_HIGHLIGHT_MARGIN, 0)
+        last += LAZY_HIGHLIGHT_MARGIN
+        self.highlighter.visible_range = (first, last)
+        block = self.document().findBlockByNumber(first)
+        while block.isValid() and block.blockNumber() <= last:
+            if block.userState() == -1:
+                self.highlighter.highlight_block_now(block)
+            block = block.next()
+    
+    def _highlight_idle_slice(self):
+        # 先把编辑引起的状态变化逐块向后传播，再按文档顺序补齐未高亮的块，单片耗时不超过帧预算
+        deadline = time.perf_counter() + HIGHLIGHT_FRAME_BUDGET_MS / 1000
+        highlighter = self.highlighter
+        while highlighter.stale_block != -1:
+            block = self.document().findBlockByNumber(highlighter.stale_block)
+            highlighter.stale_block = -1
+            if block.isValid():
+                # 结束状态改变时Qt会把下一块登记为stale_block
+                highlighter.highlight_block_now(block)
+            if time.perf_counter() >= deadline:
+                return
+        block = self.document().findBlockByNumber(self._idle_block)
+        while block.isValid():
+            if block.userState() == -1:
+                self.highlighter.highlight_block_now(block)
+            block = block.next()
+            if time.perf_counter() >= deadline:
+                break
+        if block.isValid():
+            self._idle_block = block.blockNumber()
+        else:
+            self._idle_block = 0
+            self.idle_highlight_timer.stop()
+
+# 内嵌语言的块状态：低位是内嵌分词器自己的状态，高位是内嵌区域
+EMBEDDED_STATE_BASE = 16
 
 # 基础语法高亮器
+# 子类在RULES中按优先级列出 (分组名, 正则, 格式属性名[, 匹配后进入的块状态])，每个类只编译一次为一个
+# 带命名分组的组合正则，每行只需一次finditer扫描，按匹配到的分组名取格式。
+# 跨行的注释、字符串等用块状态表示：STATES 给出每个状态的结束正则（从区域起点匹配，匹配失败表示
+# 整行仍在区域内）和区域格式，块的结束状态不变时Qt会停止向后重新高亮。
+# EMBEDDED 给出内嵌其他语言的区域：结束正则和负责该区域的语言名。
+# 格式由 highlighter_registry 按语言只创建一次，同一语言的所有高亮器共用
 class BaseHighlighter(QSyntaxHighlighter):
+    RULES = ()
+    STATES = {}
+    EMBEDDED = {}
+    
     def __init__(self, document):
         super().__init__(document)
-        self.highlighting_rules = []
+        
+        # 延迟高亮：可见范围由编辑器维护。从未高亮过的块状态为-1；范围外的块保留原状态，
+        # 让Qt的重新高亮在此停止，最靠前的这类块记在stale_block中，由编辑器在空闲时继续向后传播
+        self.lazy_threshold = LAZY_HIGHLIGHT_CHARS
+        self.visible_range = (0, -1)
+        self.stale_block = -1
+        self._forced_block = -1
+        
+        self.pattern, self.state_patterns, self.embedded_patterns = self.compiled_pattern()
+        self.group_states = {rule[0]: rule[3] for rule in self.RULES if len(rule) > 3}
+        self.apply_formats()
+        highlighter_registry.track(self)
+    
+    @classmethod
+    def build_formats(cls):
+        """创建RULES和STATES中引用的格式，返回 {格式名: QTextCharFormat}；子类在此基础上补充"""
+        formats = {}
         
         # 字符串格式
-        self.string_format = QTextCharFormat()
-        self.string_format.setForeground(Theme.SUCCESS)
+        formats['string_format'] = QTextCharFormat()
+        formats['string_format'].setForeground(Theme.SUCCESS)
         
         # 注释格式
-        self.comment_format = QTextCharFormat()
-        self.comment_format.setForeground(Theme.TEXT_DARK)
-        self.comment_format.setFontItalic(True)
-        
+        formats['comment_format'] = QTextCharFormat()
+        formats['comment_format'].setForeground(Theme.TEXT_DARK)
+        formats['comment_format'].setFontItalic(True)
+        return formats
+    
+    def apply_formats(self):
+        """从注册表取本语言共用的格式和内嵌语言的分词器"""
+        formats = highlighter_registry.formats(type(self))
+        self.group_formats = {rule[0]: formats[rule[2]] for rule in self.RULES}
+        self.state_formats = {state: formats[format_name] if format_name else None
+                              for state, (_, format_name) in self.STATES.items()}
+        self.embedded = {state: (self.embedded_patterns[state], highlighter_registry.tokenizer(language))
+                         for state, (_, language) in self.EMBEDDED.items()}
+    
+    @classmethod
+    def compiled_pattern(cls):
+        # 缓存在各子类自身上，不与父类或其他高亮器共用
+        compiled = cls.__dict__.get('_compiled_pattern')
+        if compiled is None:
+            pattern = re.compile('|'.join(f'(?P<{rule[0]}>{rule[1]})' for rule in cls.RULES))
+            state_patterns = {state: re.compile(end) for state, (end, _) in cls.STATES.items()}
+            embedded_patterns = {state: re.compile(end) for state, (end, _) in cls.EMBEDDED.items()}
+            compiled = cls._compiled_pattern = (pattern, state_patterns, embedded_patterns)
+        return compiled
+        
+    def is_lazy(self):
+        document = self.document()
+        return document is not None and document.characterCount() > self.lazy_threshold
+    
+    def is_highlighting(self):
+        return self._forced_block != -1
+    
+    def highlight_block_now(self, block):
+        """不论是否在可见范围内，立即高亮指定的块"""
+        self._forced_block = block.blockNumber()
+        self.rehighlightBlock(block)
+        self._forced_block = -1
+    
     def highlightBlock(self, text):
-        # 应用所有高亮规则
-        for pattern, format in self.highlighting_rules:
-            expression = re.compile(pattern)
-            for match in expression.finditer(text):
+        if self.is_lazy():
+            block_number = self.currentBlock().blockNumber()
+            first, last = self.visible_range
+            if block_number != self._forced_block and not first <= block_number <= last:
+                if self.stale_block == -1 or block_number < self.stale_block:
+                    self.stale_block = block_number
+                return
+        # 前一块未高亮时按普通状态开始，前一块补齐后状态变化会让Qt重新高亮本块
+        state = max(self.previousBlockState(), 0)
+        self.setCurrentBlockState(self.highlight_text(text, state, 0, min(len(text), HIGHLIGHT_MAX_LINE)))
+    
+    def highlight_text(self, text, state=0, pos=0, stop=None, target=None):
+        """为 text[pos:stop] 着色并返回结束状态；内嵌分词器通过target把格式写到外层高亮器"""
+        if stop is None:
+            stop = len(text)
+        if target is None:
+            target = self
+        group_formats = self.group_formats
+        group_states = self.group_states
+        while True:
+            if state >= EMBEDDED_STATE_BASE:
+                # 内嵌区域：到结束标签为止交给对应语言的分词器
+                inner = state % EMBEDDED_STATE_BASE
+                region = state - inner
+                end_pattern, tokenizer = self.embedded[region]
+                match = end_pattern.search(text, pos, stop)
+                region_stop = stop if match is None else match.start()
+                inner = tokenizer.highlight_text(text, inner, pos, region_stop, target)
+                if match is None:
+                    return region + inner
+                state, pos = 0, region_stop
+            elif state:
+                # 续接上一块未结束的区域
+                match = self.state_patterns[state].match(text, pos, stop)
+                end = stop if match is None else match.end()
+                region_format = self.state_formats[state]
+                if region_format is not None and end > pos:
+                    target.setFormat(pos, end - pos, region_format)
+                if match is None:
+                    return state
+                state, pos = 0, end
+            
+            # 单次扫描：组合正则中靠前的分组优先，匹配区域不再被其他规则覆盖
+            for match in self.pattern.finditer(text, pos, stop):
                 start, end = match.span()
-                self.setFormat(start, end - start, format)
-        
-        # 处理多行注释和字符串
-        self.setCurrentBlockState(0)
+                target.setFormat(start, end - start, group_formats[match.lastgroup])
+                state = group_states.get(match.lastgroup, 0)
+                if state:
+                    pos = end
+                    break
+            else:
+                return 0
+            if pos == stop:
+                return state  # 区域在行尾打开，延续到下一块
+
+# HTML关键词
+HTML_TAGS = ['html', 'head', 'body', 'title', 'meta', 'link', 'script', 'style',
+             'div', 'span', 'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+             'a', 'img', 'ul', 'ol', 'li', 'table', 'tr', 'td', 'th',
+             'form', 'input', 'button', 'select', 'option', 'textarea']
+
+# CSS关键词
+CSS_PROPERTIES = ['color', 'background', 'font-size', 'font-family',
+                  'margin', 'padding', 'border', 'display', 'position',
+                  'width', 'height', 'flex', 'grid', 'align', 'justify',
+                  'text-align', 'text-decoration']
+
+# JavaScript关键词
+JS_KEYWORDS = ['var', 'let', 'const', 'function', 'if', 'else', 'for', 'while',
+               'do', 'switch', 'case', 'default', 'return', 'break', 'continue',
+               'class', 'extends', 'import', 'export', 'from', 'async', 'await',
+               'new', 'this', 'true', 'false', 'null', 'undefined', 'typeof',
+               'instanceof', 'in', 'of', 'try', 'catch', 'finally', 'throw']
 
 # HTML语法高亮器
 class HTMLHighlighter(BaseHighlighter):
-    def __init__(self, document):
-        super().__init__(document)
+    IN_COMMENT = 1
+    IN_STYLE, IN_SCRIPT = EMBEDDED_STATE_BASE, 2 * EMBEDDED_STATE_BASE
+    
+    # 标签名和结尾的 > 分开匹配，中间的属性和字符串在同一次扫描中着色
+    RULES = (
+        ('comment', r'<!--.*?-->', 'comment_format'),
+        ('comment_open', r'<!--.*', 'comment_format', IN_COMMENT),
+        ('style_open', r'<style\b[^>]*>', 'tag_format', IN_STYLE),
+        ('script_open', r'<script\b[^>]*>', 'tag_format', IN_SCRIPT),
+        ('string', r'"[^"]*"|\'[^\']*\'', 'string_format'),
+        ('tag', r'</?(?:' + '|'.join(HTML_TAGS) + r')\b|/?>', 'tag_format'),
+        ('attr', r'\b\w+\s*=', 'attr_format'),
+    )
+    STATES = {
+        IN_COMMENT: (r'.*?-->', 'comment_format'),
+    }
+    # <style>/<script> 的内容交给CSS/JS的规则着色，结束标签交回主扫描
+    EMBEDDED = {
+        IN_STYLE: (r'</style\b', 'css'),
+        IN_SCRIPT: (r'</script\b', 'js'),
+    }
+    
+    @classmethod
+    def build_formats(cls):
+        formats = super().build_formats()
         
         # HTML标签格式
-        tag_format = QTextCharFormat()
-        tag_format.setForeground(Theme.PRIMARY_LIGHT)
-        tag_format.setFontWeight(QFont.Bold)
+        formats['tag_format'] = QTextCharFormat()
+        formats['tag_format'].setForeground(Theme.PRIMARY_LIGHT)
+        formats['tag_format'].setFontWeight(QFont.Bold)
         
         # HTML属性格式
-        attr_format = QTextCharFormat()
-        attr_format.setForeground(Theme.SECONDARY)
-        
-        # HTML关键词
-        keywords = ['html', 'head', 'body', 'title', 'meta', 'link', 'script',
-                   'div', 'span', 'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
-                   'a', 'img', 'ul', 'ol', 'li', 'table', 'tr', 'td', 'th',
-                   'form', 'input', 'button', 'select', 'option', 'textarea']
-        
-        # 添加标签规则
-        for keyword in keywords:
-            pattern = f'</?{keyword}\b[^>]*>'
-            self.highlighting_rules.append((pattern, tag_format))
-        
-        # 添加属性规则
-        self.highlighting_rules.append((r'\b\w+\s*=', attr_format))
-        
-        # 字符串规则
-        self.highlighting_rules.append((r'"[^"]*"', self.string_format))
-        self.highlighting_rules.append((r"'[^']*'", self.string_format))
+        formats['attr_format'] = QTextCharFormat()
+        formats['attr_format'].setForeground(Theme.SECONDARY)
+        return formats
 
 # CSS语法高亮器
 class CSSHighlighter(BaseHighlighter):
-    def __init__(self, document):
-        super().__init__(document)
+    IN_COMMENT = 1
+    
+    RULES = (
+        ('comment', r'/\*.*?\*/', 'comment_format'),
+        ('comment_open', r'/\*.*', 'comment_format', IN_COMMENT),
+        ('string', r'"[^"]*"|\'[^\']*\'', 'string_format'),
+        ('selector', r'[^@\s{][^{]*?(?=\s*\{)', 'selector_format'),
+        ('property', r'\b(?:' + '|'.join(CSS_PROPERTIES) + r')\b\s*:', 'property_format'),
+        ('color', r'#[0-9a-fA-F]{3,6}', 'value_format'),
+        ('unit', r'\b\d+\.?\d*\s*(?:px|em|rem|%|vh|vw)\b', 'value_format'),
+    )
+    STATES = {
+        IN_COMMENT: (r'.*?\*/', 'comment_format'),
+    }
+    
+    @classmethod
+    def build_formats(cls):
+        formats = super().build_formats()
         
         # CSS选择器格式
-        selector_format = QTextCharFormat()
-        selector_format.setForeground(Theme.BLOCK_CSS)
-        selector_format.setFontWeight(QFont.Bold)
+        formats['selector_format'] = QTextCharFormat()
+        formats['selector_format'].setForeground(Theme.BLOCK_CSS)
+        formats['selector_format'].setFontWeight(QFont.Bold)
         
         # CSS属性格式
-        property_format = QTextCharFormat()
-        property_format.setForeground(Theme.SECONDARY)
+        formats['property_format'] = QTextCharFormat()
+        formats['property_format'].setForeground(Theme.SECONDARY)
         
         # CSS值格式
-        value_format = QTextCharFormat()
-        value_format.setForeground(Theme.TEXT_SECONDARY)
-        
-        # CSS关键词
-        properties = ['color', 'background', 'font-size', 'font-family',
-                     'margin', 'padding', 'border', 'display', 'position',
-                     'width', 'height', 'flex', 'grid', 'align', 'justify',
-                     'text-align', 'text-decoration']
-        
-        # 添加选择器规则
-        self.highlighting_rules.append((r'[^@\s{][^{]*?(?=\s*\{)', selector_format))
-        
-        # 添加属性规则
-        for prop in properties:
-            self.highlighting_rules.append((fr'\b{prop}\b\s*:', property_format))
-        
-        # 添加值规则（颜色）
-        self.highlighting_rules.append((r'#[0-9a-fA-F]{3,6}', value_format))
-        
-        # 添加值规则（单位）
-        self.highlighting_rules.append((r'\b\d+\.?\d*\s*(px|em|rem|%|vh|vw)\b', value_format))
-        
-        # 字符串规则
-        self.highlighting_rules.append((r'"[^"]*"', self.string_format))
-        self.highlighting_rules.append((r"'[^']*'", self.string_format))
-        
-        # 注释规则
-        self.highlighting_rules.append((r'\/\*.*?\*\/', self.comment_format))
+        formats['value_format'] = QTextCharFormat()
+        formats['value_format'].setForeground(Theme.TEXT_SECONDARY)
+        return formats
 
 # JavaScript语法高亮器
 class JavaScriptHighlighter(BaseHighlighter):
-    def __init__(self, document):
-        super().__init__(document)
+    IN_COMMENT, IN_DOUBLE_QUOTE, IN_SINGLE_QUOTE, IN_TEMPLATE = 1, 2, 3, 4
+    
+    # 普通字符串只有行尾反斜杠续行时才跨行，模板字符串可以直接跨行
+    RULES = (
+        ('comment', r'//.*$|/\*.*?\*/', 'comment_format'),
+        ('comment_open', r'/\*.*', 'comment_format', IN_COMMENT),
+        ('string', r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`(?:\\.|[^`\\])*`', 'string_format'),
+        ('double_quote_open', r'"(?:\\.|[^"\\])*\\$', 'string_format', IN_DOUBLE_QUOTE),
+        ('single_quote_open', r'\'(?:\\.|[^\'\\])*\\$', 'string_format', IN_SINGLE_QUOTE),
+        ('template_open', r'`(?:\\.|[^`\\])*\\?$', 'string_format', IN_TEMPLATE),
+        ('keyword', r'\b(?:' + '|'.join(JS_KEYWORDS) + r')\b', 'keyword_format'),
+        ('function', r'\b\w+(?=\s*\()', 'function_format'),
+        ('number', r'\b\d+\.?\d*\b', 'number_format'),
+    )
+    # 续行字符串在没有反斜杠的行尾结束（未闭合），模板字符串和注释持续到结束符
+    STATES = {
+        IN_COMMENT: (r'.*?\*/', 'comment_format'),
+        IN_DOUBLE_QUOTE: (r'(?:\\.|[^"\\])*(?:"|$)', 'string_format'),
+        IN_SINGLE_QUOTE: (r'(?:\\.|[^\'\\])*(?:\'|$)', 'string_format'),
+        IN_TEMPLATE: (r'(?:\\.|[^`\\])*`', 'string_format'),
+    }
+    
+    @classmethod
+    def build_formats(cls):
+        formats = super().build_formats()
         
         # 关键字格式
-        keyword_format = QTextCharFormat()
-        keyword_format.setForeground(Theme.BLOCK_JS)
-        keyword_format.setFontWeight(QFont.Bold)
+        formats['keyword_format'] = QTextCharFormat()
+        formats['keyword_format'].setForeground(Theme.BLOCK_JS)
+        formats['keyword_format'].setFontWeight(QFont.Bold)
         
         # 函数名格式
-        function_format = QTextCharFormat()
-        function_format.setForeground(Theme.ACCENT)
-        function_format.setFontWeight(QFont.Bold)
-        
-        # JavaScript关键词
-        keywords = ['var', 'let', 'const', 'function', 'if', 'else', 'for', 'while',
-                   'do', 'switch', 'case', 'default', 'return', 'break', 'continue',
-                   'class', 'extends', 'import', 'export', 'from', 'async', 'await',
-                   'new', 'this', 'true', 'false', 'null', 'undefined', 'typeof',
-                   'instanceof', 'in', 'of', 'try', 'catch', 'finally', 'throw']
-        
-        # 添加关键字规则
-        for keyword in keywords:
-            self.highlighting_rules.append((fr'\b{keyword}\b', keyword_format))
-        
-        # 添加函数规则
-        self.highlighting_rules.append((r'\b\w+(?=\s*\()', function_format))
-        
-        # 数字规则
-        number_format = QTextCharFormat()
-        number_format.setForeground(Theme.WARNING)
-        self.highlighting_rules.append((r'\b\d+\.?\d*\b', number_format))
-        
-        # 字符串规则
-        self.highlighting_rules.append((r'"[^"]*"', self.string_format))
-        self.highlighting_rules.append((r"'[^']*'", self.string_format))
-        self.highlighting_rules.append((r'`[^`]*`', self.string_format))
-        
-        # 注释规则
-        self.highlighting_rules.append((r'\/\/.*$', self.comment_format))
-        self.highlighting_rules.append((r'\/\*.*?\*\/', self.comment_format))
+        formats['function_format'] = QTextCharFormat()
+        formats['function_format'].setForeground(Theme.ACCENT)
+        formats['function_format'].setFontWeight(QFont.Bold)
+        
+        # 数字格式
+        formats['number_format'] = QTextCharFormat()
+        formats['number_format'].setForeground(Theme.WARNING)
+        return formats
+
+# 高亮器注册表 - 按语言名查找高亮器类，每种语言的格式和内嵌分词器只创建一次，
+# 所有编辑器（包括以后的项目标签页）共用；主题改变时重建一次格式并通知所有高亮器
+class HighlighterRegistry(QObject):
+    def __init__(self):
+        super().__init__()
+        self.languages = {}
+        self._formats = {}
+        self._tokenizers = {}
+        self._highlighters = weakref.WeakSet()
+    
+    def register(self, language, highlighter_class):
+        self.languages[language] = highlighter_class
+    
+    def create(self, language, document):
+        """为文档创建指定语言的高亮器，未注册的语言返回None"""
+        highlighter_class = self.languages.get(language)
+        if highlighter_class is None:
+            return None
+        return highlighter_class(document)
+    
+    def formats(self, highlighter_class):
+        formats = self._formats.get(highlighter_class)
+        if formats is None:
+            formats = self._formats[highlighter_class] = highlighter_class.build_formats()
+        return formats
+    
+    def tokenizer(self, language):
+        """内嵌区域用的分词器：不绑定文档，只借用规则，格式写回外层高亮器"""
+        tokenizer = self._tokenizers.get(language)
+        if tokenizer is None:
+            tokenizer = self._tokenizers[language] = self.languages[language](self)
+        return tokenizer
+    
+    def track(self, highlighter):
+        self._highlighters.add(highlighter)
+    
+    def update_theme(self):
+        """Theme 的颜色改变后调用：每种语言重建一次格式，再重新高亮所有打开的文档"""
+        self._formats.clear()
+        highlighters = [h for h in self._highlighters if not sip.isdeleted(h)]
+        # 先全部换上新格式，内嵌分词器也要在外层文档重新高亮之前换好
+        for highlighter in highlighters:
+            highlighter.apply_formats()
+        for highlighter in highlighters:
+            if highlighter.document() is not None:
+                highlighter.rehighlight()
+
+highlighter_registry = HighlighterRegistry()
+highlighter_registry.register('html', HTMLHighlighter)
+highlighter_registry.register('css', CSSHighlighter)
+highlighter_registry.register('js', JavaScriptHighlighter)
+
+# 文档组装器 - 预览、保存和导出共用，把CSS和JS拼接进HTML外壳
+class DocumentAssembler:
+    # 拼接计划中的占位符：分别代表CSS和JS文本
+    CSS = 0
+    JS = 1
+
+    def __init__(self):
+        self._html = None
+        self._plan = None
+        self._lock = threading.Lock()  # 预览在工作线程中组装，保存在GUI线程中组装
+
+    def assemble(self, html, css, js):
+        """组装完整文档；HTML外壳不变时复用上次扫描得到的拼接位置"""
+        with self._lock:
+            if html is not self._html and html != self._html:
+                self._plan = self._build_plan(html)
+                self._html = html
+            plan = self._plan
+        values = (css, js)
+        parts = []
+        for step in plan:
+            if type(step) is tuple:
+                parts.append(html[step[0]:step[1]])
+            elif type(step) is int:
+                parts.append(values[step])
+            else:
+                parts.append(step)
+        return ''.join(parts)
+
+    def _build_plan(self, html):
+        """扫描一次HTML，得到由源码片段、字面量和占位符组成的拼接计划"""
+        style_start = html.find('<style>')
+        style_end = html.find('</style>', style_start) if style_start != -1 else -1
+        head_start = html.find('<head>')
+
+        if style_end != -1:
+            # 替换第一个<style>元素的内容
+            lo, hi = 0, len(html)
+            edits = [(style_start + 7, style_end, '\n', self.CSS, '\n')]
+            prefix = suffix = ''
+        elif head_start != -1:
+            # 在<head>之后插入新的<style>元素
+            lo, hi = 0, len(html)
+            edits = [(head_start + 6, head_start + 6, '\n    <style>\n', self.CSS, '\n    </style>')]
+            prefix = suffix = ''
+        else:
+            # 没有<head>时补全文档结构，只保留body中的内容
+            body_start = html.find('<body>')
+            body_end = html.rfind('</body>')
+            if body_start != -1 and body_end > body_start:
+                lo, hi = body_start + 6, body_end
+            else:
+                lo, hi = 0, len(html)
+            edits = []
+            prefix = ('<!DOCTYPE html>\n<html>\n<head>\n    <meta charset="UTF-8">\n    <style>\n',
+                      self.CSS, '\n    </style>\n</head>\n<body>\n')
+            suffix = '\n</body>\n</html>'
+
+        # 替换第一个<script>元素的内容，与CSS位置冲突时视为没有
+        script_start = html.find('<script>', lo, hi)
+        script_end = html.find('</script>', script_start, hi) if script_start != -1 else -1
+        if script_end != -1 and all(end <= script_start or start >= script_end + 9
+                                    for start, end, _, _, _ in edits):
+            edits.append((script_start + 8, script_end, '\n', self.JS, '\n'))
+        elif suffix:
+            suffix = ('\n    <script>\n', self.JS, '\n    </script>\n</body>\n</html>')
+        else:
+            body_close = html.rfind('</body>')
+            if body_close == -1:
+                body_close = html.rfind('</html>')
+            if body_close != -1:
+                edits.append((body_close, body_close, '    <script>\n', self.JS, '\n    </script>\n'))
+
+        plan = []
+        if prefix:
+            plan.extend(prefix)
+        pos = lo
+        for start, end, before, placeholder, after in sorted(edits):
+            if start > pos:
+                plan.append((pos, start))
+            plan.extend((before, placeholder, after))
+            pos = end
+        if hi > pos:
+            plan.append((pos, hi))
+        if isinstance(suffix, tuple):
+            plan.extend(suffix)
+        elif suffix:
+            plan.append(suffix)
+        return plan
+
+# 预览渲染记录 - 记住预览当前显示的 (html, css, js)，内容相同时跳过渲染
+class PreviewRenderMemo:
+    def __init__(self):
+        self._key = None
+        self.rendered = 0  # 实际渲染次数
+        self.skipped = 0  # 跳过次数
+
+    def is_current(self, key):
+        """key与预览当前显示的内容一致时返回True，并计入跳过次数"""
+        if self._key is not None and key == self._key:
+            self.skipped += 1
+            return True
+        return False
+
+    def remember(self, key):
+        self._key = key
+        self.rendered += 1
+
+    def forget(self):
+        """预览内容已不可信（加载失败、补丁失败等），下次必须渲染"""
+        self._key = None
+
+def register_preview_scheme():
+    """注册预览协议，必须在创建QApplication之前调用"""
+    global _preview_scheme_registered
+    if _preview_scheme_registered:
+        return
+    scheme = QWebEngineUrlScheme(PREVIEW_SCHEME)
+    scheme.setSyntax(QWebEngineUrlScheme.Host)
+    scheme.setFlags(QWebEngineUrlScheme.SecureScheme |
+                    QWebEngineUrlScheme.LocalAccessAllowed |
+                    QWebEngineUrlScheme.CorsEnabled)
+    QWebEngineUrlScheme.registerScheme(scheme)
+    _preview_scheme_registered = True
+
+def preview_scheme_registered():
+    return _preview_scheme_registered
+
+# 预览资源存储 - 内存中的文档加上项目目录中的静态资源，均以ETag标识版本
+class PreviewResourceStore:
+    def __init__(self):
+        self.root_dir = None  # 项目目录，用于解析图片、字体、拆分的CSS/JS等相对路径
+        self._documents = {}  # 路径 -> (数据, MIME类型, ETag)
+        self._files = {}  # 文件路径 -> (修改时间, 大小, 数据, MIME类型, ETag)
+
+    @staticmethod
+    def make_etag(data):
+        return hashlib.sha1(data).hexdigest()[:16]
+
+    def set_root(self, root_dir):
+        if root_dir != self.root_dir:
+            self.root_dir = root_dir
+            self._files.clear()
+
+    def publish_data(self, path, data, etag, mime_type='text/html'):
+        """发布已编码的文档（编码和ETag可在工作线程中预先计算）"""
+        current = self._documents.get(path)
+        if current is None or current[2] != etag:
+            self._documents[path] = (data, mime_type + '; charset=utf-8', etag)
+
+    def lookup(self, path):
+        """按URL路径查找资源，返回 (数据, MIME类型, ETag)，找不到时返回None"""
+        if path in self._documents:
+            return self._documents[path]
+        if not self.root_dir:
+            return None
+        # 解析符号链接后再比较，项目内指向外部的链接不能越出根目录
+        root = os.path.realpath(self.root_dir)
+        file_path = os.path.realpath(os.path.join(root, path.lstrip('/')))
+        try:
+            if os.path.commonpath([root, file_path]) != root:
+                return None
+        except ValueError:
+            return None  # 不同驱动器等无法比较的路径，按找不到处理
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        cached = self._files.get(file_path)
+        if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2:]
+        try:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        mime_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+        entry = (stat.st_mtime_ns, stat.st_size, data, mime_type, self.make_etag(data))
+        self._files[file_path] = entry
+        return entry[2:]
+
+# 预览协议处理器 - 从PreviewResourceStore中读取资源回复给WebEngine
+class PreviewSchemeHandler(QWebEngineUrlSchemeHandler):
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+
+    def requestStarted(self, job):
+        entry = self.store.lookup(job.requestUrl().path())
+        if entry is None:
+            job.fail(QWebEngineUrlRequestJob.UrlNotFound)
+            return
+        data, mime_type, _ = entry
+        buffer = QBuffer(job)
+        buffer.setData(data)
+        buffer.open(QIODevice.ReadOnly)
+        job.reply(mime_type.encode('ascii'), buffer)
+
+# 预览组装结果 - 由工作线程生成，在GUI线程中应用
+class PreviewAssembly:
+    def __init__(self, generation, sources, rendered_html):
+        self.generation = generation  # 提交时的渲染代数，用于丢弃过期结果
+        self.sources = sources  # (html, css, js) 快照
+        self.rendered_html = rendered_html  # 提交时预览页对应的HTML源码
+        self.html_unchanged = False  # HTML与预览页一致，只需注入CSS/JS
+        self.body = None  # 外壳未变时的新<body>标记，用于DOM补丁
+        self.document = None
+        self.data = None  # 预览协议使用的UTF-8编码数据
+        self.etag = None
+        self.timing = None  # PreviewLatencyMonitor.begin_render 返回的计时记录
+        self.assembly_ms = 0.0
+        self.force_full = False  # 手动运行预览：必须完整加载页面
+
+class PreviewAssemblySignals(QObject):
+    finished = pyqtSignal(object)
+
+# 预览组装任务 - 在线程池中完成拼接、外壳比较和编码，GUI线程只负责提交快照和应用结果
+class PreviewAssemblyTask(QRunnable):
+    def __init__(self, result, assembler, signals, encode=True):
+        super().__init__()
+        self.result = result
+        self.assembler = assembler
+        self.signals = signals  # 由主窗口持有，保证排队的信号能送达
+        self.encode = encode
+
+    def run(self):
+        result = self.result
+        started = time.perf_counter()
+        html, css, js = result.sources
+        result.document = self.assembler.assemble(html, css, js)
+
+        rendered_html = result.rendered_html
+        if rendered_html is not None:
+            if html == rendered_html:
+                result.html_unchanged = True
+            else:
+                shell = split_page_shell(html)
+                rendered_shell = split_page_shell(rendered_html)
+                if (shell is not None and rendered_shell is not None
+                        and shell[0] == rendered_shell[0] and shell[2] == rendered_shell[2]):
+                    document_shell = split_page_shell(result.document)
+                    if document_shell is not None:
+                        result.body = document_shell[1]
+
+        if self.encode:
+            result.data = result.document.encode('utf-8')
+            result.etag = PreviewResourceStore.make_etag(result.data)
+        result.assembly_ms = (time.perf_counter() - started) * 1000
+        self.signals.finished.emit(result)
+
+# 预览延迟监控 - 记录每次渲染各阶段的耗时（毫秒），保存在环形缓冲区中
+class PreviewLatencyMonitor(QObject):
+    updated = pyqtSignal()
+
+    # (字段名, 显示名称)
+    STAGES = [
+        ('total', '编辑到渲染'),
+        ('debounce', '防抖等待'),
+        ('codegen', '积木生成'),
+        ('assembly', '文档组装'),
+        ('render', '页面渲染'),
+        ('queue', '等待加载'),
+        ('load', '页面加载'),
+        ('parse', 'HTML解析'),
+        ('scripts', '脚本执行'),
+    ]
+
+    def __init__(self, capacity=1000, parent=None):
+        super().__init__(parent)
+        self.records = deque(maxlen=capacity)
+        self._edit_time = None  # 本轮第一次编辑的时间
+        self._codegen_start = None  # 积木生成代码的开始时间
+        self._inflight = None  # 已提交但尚未完成的渲染
+
+    def mark_edit(self):
+        """记录编辑时间，一轮合并渲染只记第一次"""
+        if self._edit_time is None:
+            self._edit_time = time.perf_counter()
+
+    def mark_codegen_start(self):
+        self.mark_edit()
+        self._codegen_start = time.perf_counter()
+
+    def discard_edit(self):
+        """渲染被跳过时丢弃本轮编辑时间"""
+        self._edit_time = None
+        self._codegen_start = None
+
+    def begin_render(self):
+        """开始一次渲染，返回计时记录；被新渲染取代时沿用最早的编辑时间"""
+        now = time.perf_counter()
+        edit_time = self._edit_time or now
+        if self._inflight is not None:
+            edit_time = min(edit_time, self._inflight['edit'])
+        timing = {
+            'edit': edit_time,
+            'submit': now,
+            'codegen': (now - self._codegen_start) * 1000 if self._codegen_start else None,
+        }
+        self._edit_time = None
+        self._codegen_start = None
+        self._inflight = timing
+        return timing
+
+    def finish_render(self, timing, kind, parse_ms=None, scripts_ms=None):
+        now = time.perf_counter()
+        applied = timing.get('applied', now)
+        # 完整加载才有：应用结果到Chromium开始加载（排队），开始加载到加载完成（解析和脚本）
+        load_started = timing.get('load_started')
+        load_finished = timing.get('load_finished', now)
+        self.records.append({
+            'time': time.strftime('%H:%M:%S'),
+            'kind': kind,
+            'total': (now - timing['edit']) * 1000,
+            'debounce': (timing['submit'] - timing['edit']) * 1000,
+            'codegen': timing['codegen'],
+            'assembly': timing.get('assembly'),
+            'render': (now - applied) * 1000,
+            'queue': (load_started - applied) * 1000 if load_started is not None else None,
+            'load': (load_finished - load_started) * 1000 if load_started is not None else None,
+            'parse': parse_ms,
+            'scripts': scripts_ms,
+        })
+        if self._inflight is timing:
+            self._inflight = None
+        self.updated.emit()
+
+    def percentiles(self, stage, points=(50, 95, 99)):
+        """返回 (样本数, [各百分位数])，使用最近秩法"""
+        values = sorted(r[stage] for r in self.records if r[stage] is not None)
+        if not values:
+            return 0, [None] * len(points)
+        count = len(values)
+        return count, [values[min(count - 1, max(0, -(-p * count // 100) - 1))] for p in points]
+
+    def clear(self):
+        self.records.clear()
+        self.updated.emit()
+
+    def export_csv(self, file_path):
+        fields = ['time', 'kind'] + [name for name, _ in self.STAGES]
+        with open(file_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for record in self.records:
+                writer.writerow({key: (f'{value:.2f}' if isinstance(value, float) else value)
+                                 for key, value in record.items()})
+
+# 延迟直方图 - 按对数区间统计“编辑到渲染”耗时
+class LatencyHistogram(QWidget):
+    BUCKETS = [8, 16, 33, 50, 100, 200, 500, 1000]  # 区间上界（毫秒）
+
+    def __init__(self, monitor, parent=None):
+        super().__init__(parent)
+        self.monitor = monitor
+        self.setMinimumHeight(140)
+
+    def paintEvent(self, event):
+        counts = [0] * (len(self.BUCKETS) + 1)
+        for record in self.monitor.records:
+            value = record['total']
+            index = 0
+            while index < len(self.BUCKETS) and value > self.BUCKETS[index]:
+                index += 1
+            counts[index] += 1
+
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Theme.SURFACE_DARK)
+        label_height = 18
+        width = self.width() / len(counts)
+        height = self.height() - label_height * 2
+        peak = max(counts) or 1
+        labels = [f'≤{b}' for b in self.BUCKETS] + [f'>{self.BUCKETS[-1]}']
+        painter.setFont(QFont("Arial", 8))
+        for i, count in enumerate(counts):
+            bar = int(height * count / peak)
+            x = int(i * width)
+            painter.fillRect(x + 2, label_height + height - bar, int(width) - 4, bar, Theme.PRIMARY)
+            painter.setPen(QPen(Theme.TEXT_SECONDARY))
+            painter.drawText(x, self.height() - label_height, int(width), label_height, Qt.AlignCenter, labels[i])
+            if count:
+                painter.drawText(x, label_height + height - bar - label_height, int(width), label_height,
+                                 Qt.AlignCenter, str(count))
+        painter.end()
+
+# 预览性能面板 - 显示各阶段的p50/p95/p99，并可导出CSV
+class PreviewLatencyPanel(QDockWidget):
+    def __init__(self, monitor, parent=None):
+        super().__init__('预览性能', parent)
+        self.monitor = monitor
+        self.setObjectName('preview_latency_panel')
+
+        container = QWidget()
+        layout = QVBoxLayout(container)
+
+        self.table = QTableWidget(len(monitor.STAGES), 4)
+        self.table.setHorizontalHeaderLabels(['样本数', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)'])
+        self.table.setVerticalHeaderLabels([label for _, label in monitor.STAGES])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        self.histogram = LatencyHistogram(monitor)
+        layout.addWidget(QLabel('编辑到渲染耗时分布 (ms)'))
+        layout.addWidget(self.histogram)
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        clear_btn = QPushButton('清空')
+        clear_btn.clicked.connect(monitor.clear)
+        export_btn = QPushButton('导出CSV')
+        export_btn.clicked.connect(self.export_csv)
+        button_layout.addWidget(clear_btn)
+        button_layout.addWidget(export_btn)
+        layout.addLayout(button_layout)
+
+        self.setWidget(container)
+        monitor.updated.connect(self.refresh)
+        self.refresh()
+
+    def refresh(self):
+        for row, (stage, _) in enumerate(self.monitor.STAGES):
+            count, values = self.monitor.percentiles(stage)
+            self.table.setItem(row, 0, QTableWidgetItem(str(count)))
+            for column, value in enumerate(values, start=1):
+                text = '-' if value is None else f'{value:.1f}'
+                self.table.setItem(row, column, QTableWidgetItem(text))
+        self.histogram.update()
+
+    def export_csv(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "导出预览延迟数据", "preview_latency.csv",
+                                                   "CSV Files (*.csv);;All Files (*)")
+        if file_path:
+            try:
+                self.monitor.export_csv(file_path)
+            except Exception as e:
+                QMessageBox.critical(self, '错误', f'无法导出文件: {str(e)}')
+
+# 多视口预览 - 多个固定宽度的视图共享同一份组装结果，不可见的视口延迟到可见或空闲时再加载
+class ResponsivePreviewPanel(QWidget):
+    def __init__(self, store, profile=None, widths=PREVIEW_VIEWPORT_WIDTHS, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self._result = None  # 最近一次组装结果
+        self.viewports = []  # [视图, 是否过期]
+
+        row = QWidget()
+        row_layout = QHBoxLayout(row)
+        for width in widths:
+            column = QVBoxLayout()
+            label = QLabel(f'{width} px')
+            label.setAlignment(Qt.AlignCenter)
+            label.setStyleSheet(f"color: {Theme.TEXT_SECONDARY.name()};")
+            view = QWebEngineView()
+            if profile is not None:
+                view.setPage(QWebEnginePage(profile, view))
+            view.setFixedWidth(width)
+            column.addWidget(label)
+            column.addWidget(view)
+            row_layout.addLayout(column)
+            self.viewports.append([view, False])
+        row_layout.addStretch()
+
+        self.scroll_area = QScrollArea()
+        self.scroll_area.setWidget(row)
+        self.scroll_area.setWidgetResizable(True)
+        self.scroll_area.horizontalScrollBar().valueChanged.connect(self.refresh_visible)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.scroll_area)
+
+        # 编辑停止后统一刷新所有过期视口
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.setInterval(PREVIEW_VIEWPORT_IDLE_MS)
+        self.idle_timer.timeout.connect(self.refresh_all)
+
+    def show_result(self, result):
+        """接收新的组装结果：可见视口立即加载，其余标记为过期"""
+        self._result = result
+        if preview_scheme_registered():
+            self.store.publish_data(PREVIEW_DOCUMENT_PATH, result.data, result.etag)
+        for viewport in self.viewports:
+            viewport[1] = True
+        self.refresh_visible()
+        self.idle_timer.start()
+
+    def reload_all(self):
+        if self._result is not None:
+            for viewport in self.viewports:
+                viewport[1] = True
+            self.refresh_visible()
+            self.idle_timer.start()
+
+    def refresh_visible(self):
+        for viewport in self.viewports:
+            view, stale = viewport
+            if stale and view.isVisible() and not view.visibleRegion().isEmpty():
+                self._load(viewport)
+
+    def refresh_all(self):
+        for viewport in self.viewports:
+            if viewport[1]:
+                self._load(viewport)
+
+    def stale_count(self):
+        return sum(1 for _, stale in self.viewports if stale)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        QTimer.singleShot(0, self.refresh_visible)
+
+    def _load(self, viewport):
+        view = viewport[0]
+        viewport[1] = False
+        result = self._result
+        if not preview_scheme_registered():
+            view.setHtml(result.document)
+            return
+        url = QUrl(f'{PREVIEW_SCHEME.decode()}://{PREVIEW_HOST}{PREVIEW_DOCUMENT_PATH}')
+        url.setQuery(f'v={result.etag}')
+        view.setUrl(url)
+
+# 预览调度器 - 合并短时间内的多次变更通知，只触发一次预览渲染
+class PreviewScheduler(QObject):
+    triggered = pyqtSignal()
+
+    def __init__(self, quiet_ms=PREVIEW_QUIET_MS, max_latency_ms=PREVIEW_MAX_LATENCY_MS, parent=None):
+        super().__init__(parent)
+        self.quiet_ms = quiet_ms  # 静默期：最后一次变更后等待的时间
+        self.max_latency_ms = max_latency_ms  # 最大延迟：第一次变更后最迟多久必须渲染
+
+        self._quiet_timer = QTimer(self)
+        self._quiet_timer.setSingleShot(True)
+        self._quiet_timer.timeout.connect(self._fire)
+
+        self._deadline_timer = QTimer(self)
+        self._deadline_timer.setSingleShot(True)
+        self._deadline_timer.timeout.connect(self._fire)
+
+    def schedule(self):
+        """记录一次变更，静默期结束或到达最大延迟时渲染"""
+        self._quiet_timer.start(self.quiet_ms)
+        if not self._deadline_timer.isActive():
+            self._deadline_timer.start(self.max_latency_ms)
+
+    def flush(self):
+        """跳过等待，立即渲染（合并所有挂起的变更）"""
+        self._fire()
+
+    def cancel(self):
+        """丢弃挂起的渲染请求"""
+        self._quiet_timer.stop()
+        self._deadline_timer.stop()
+
+    def is_pending(self):
+        return self._quiet_timer.isActive() or self._deadline_timer.isActive()
+
+    def _fire(self):
+        self.cancel()
+        self.triggered.emit()
+
+# 文件加载 - 在线程池中分块读取并增量解码，GUI线程按批追加到编辑器
+FILE_LOAD_CHUNK_BYTES = 256 * 1024
+FILE_FEED_BATCH_CHARS = 32 * 1024
+
+class FileLoadSignals(QObject):
+    chunk = pyqtSignal(int, str)  # 加载代数、解码后的文本
+    progress = pyqtSignal(int, int, int)  # 加载代数、已读字节数、总字节数
+    finished = pyqtSignal(int, str)  # 加载代数、错误信息（成功时为空）
+
+class FileLoadTask(QRunnable):
+    def __init__(self, generation, file_path, signals):
+        super().__init__()
+        self.generation = generation
+        self.file_path = file_path
+        self.signals = signals
+        self.cancelled = False
+
+    def run(self):
+        generation = self.generation
+        try:
+            total = os.path.getsize(self.file_path)
+            # 与文本模式打开一致，把 \r\n 和 \r 统一为 \n（跨块的 \r\n 也能正确处理）
+            decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf-8')(), translate=True)
+            read = 0
+            with open(self.file_path, 'rb') as f:
+                while not self.cancelled:
+                    data = f.read(FILE_LOAD_CHUNK_BYTES)
+                    read += len(data)
+                    # 多字节字符跨块时由解码器保留到下一块
+                    text = decoder.decode(data, final=not data)
+                    if text:
+                        self.signals.chunk.emit(generation, text)
+                    self.signals.progress.emit(generation, read, total)
+                    if not data:
+                        break
+        except Exception as e:
+            self.signals.finished.emit(generation, str(e))
+            return
+        self.signals.finished.emit(generation, '')
+
+# 大文件模式：超过阈值的文件通过mmap只读查看，行索引随滚动按需建立，选中的区域可单独编辑后流式写回
+LARGE_FILE_THRESHOLD = 20 * 1024 * 1024
+LINE_INDEX_BATCH = 2000
+LARGE_FILE_LINE_PREVIEW = 1000
+LARGE_FILE_COPY_CHUNK = 1024 * 1024
+
+class MappedLineModel(QAbstractListModel):
+    def __init__(self, file_path, parent=None):
+        super().__init__(parent)
+        self.file_path = file_path
+        self._file = None
+        self._map = None
+        self.open()
+
+    def open(self):
+        self._file = open(self.file_path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        # 空文件不能映射
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        self.offsets = array('q', [0])  # 第 i 行占 offsets[i]:offsets[i + 1] 字节
+        self.complete = self.size == 0
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        if self._file is not None:
+            self._file.close()
+        self._map = self._file = None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.offsets) - 1
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and not self.complete
+
+    def fetchMore(self, parent):
+        # 从已索引的末尾继续查找换行符，每次最多索引一批
+        if self.complete:
+            return
+        pos = self.offsets[-1]
+        new_offsets = []
+        for _ in range(LINE_INDEX_BATCH):
+            newline = self._map.find(b'\n', pos)
+            if newline == -1:
+                new_offsets.append(self.size)  # 末行没有换行符
+                self.complete = True
+                break
+            pos = newline + 1
+            new_offsets.append(pos)
+            if pos >= self.size:
+                self.complete = True
+                break
+        row = self.rowCount()
+        self.beginInsertRows(QModelIndex(), row, row + len(new_offsets) - 1)
+        self.offsets.extend(new_offsets)
+        self.endInsertRows()
+
+    def ensure_rows(self, count):
+        while self.rowCount() < count and not self.complete:
+            self.fetchMore(QModelIndex())
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        row = index.row()
+        start = self.offsets[row]
+        end = min(self.offsets[row + 1], start + LARGE_FILE_LINE_PREVIEW * 4)
+        text = self._map[start:end].decode('utf-8', 'replace').rstrip('\r\n')
+        if len(text) > LARGE_FILE_LINE_PREVIEW or end < self.offsets[row + 1]:
+            text = text[:LARGE_FILE_LINE_PREVIEW] + ' …'
+        return f'{row + 1:>8}  {text}'
+
+    def region_bytes(self, first, last):
+        return self._map[self.offsets[first]:self.offsets[last + 1]]
+
+    def region_text(self, first, last):
+        """区域的文本，不含最后一行的换行符（写回时保留原来的行尾）"""
+        region = self.region_bytes(first, last)
+        text = region.decode('utf-8').replace('\r\n', '\n')
+        return text[:-1] if text.endswith('\n') else text
+
+    def write_region(self, first, last, text):
+        """用 text 替换第 first 到 last 行：流式复制到临时文件后替换原文件，再重新映射"""
+        start, end = self.offsets[first], self.offsets[last + 1]
+        region = self.region_bytes(first, last)
+        line_end = b'\r\n' if region.endswith(b'\r\n') else b'\n' if region.endswith(b'\n') else b''
+        if b'\r\n' in region:
+            text = text.replace('\n', '\r\n')  # 保持原有的换行风格
+        data = text.encode('utf-8') + line_end
+        # 符号链接替换其指向的文件，链接本身保持不变
+        real_path = os.path.realpath(self.file_path)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(real_path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for begin, stop in ((0, start), (end, self.size)):
+                    for offset in range(begin, stop, LARGE_FILE_COPY_CHUNK):
+                        out.write(self._map[offset:min(offset + LARGE_FILE_COPY_CHUNK, stop)])
+                    if begin == 0:
+                        out.write(data)
+            shutil.copymode(real_path, temp_path)  # mkstemp创建的文件权限为0600，沿用原文件的权限
+            self.beginResetModel()
+            self.close()
+            os.replace(temp_path, real_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        finally:
+            if self._file is None:
+                self.open()
+                self.endResetModel()
+
+class LargeFileRegionDialog(QDialog):
+    def __init__(self, text, first, last, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f'编辑第 {first + 1} - {last + 1} 行')
+        self.resize(900, 600)
+        layout = QVBoxLayout(self)
+        self.editor = CodeEditor('html')
+        self.editor.setPlainText(text)
+        layout.addWidget(self.editor)
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        apply_btn = QPushButton('写回文件')
+        apply_btn.clicked.connect(self.accept)
+        cancel_btn = QPushButton('取消')
+        cancel_btn.clicked.connect(self.reject)
+        button_layout.addWidget(apply_btn)
+        button_layout.addWidget(cancel_btn)
+        layout.addLayout(button_layout)
+
+class LargeFileViewer(QWidget):
+    closed = pyqtSignal()
+
+    def __init__(self, file_path, parent=None):
+        super().__init__(parent)
+        self.model = MappedLineModel(file_path, self)
+
+        layout = QVBoxLayout(self)
+        header = QHBoxLayout()
+        size_mb = self.model.size / (1024 * 1024)
+        info = QLabel(f'{os.path.basename(file_path)} · {size_mb:.1f} MB · 只读')
+        info.setStyleSheet(f"color: {Theme.TEXT_SECONDARY.name()};")
+        edit_btn = QPushButton('编辑所选行')
+        edit_btn.setToolTip('在单独的编辑窗口中修改选中的连续行，保存后写回文件')
+        edit_btn.clicked.connect(self.edit_selection)
+        close_btn = QPushButton('关闭')
+        close_btn.clicked.connect(self.closed.emit)
+        header.addWidget(info)
+        header.addStretch()
+        header.addWidget(edit_btn)
+        header.addWidget(close_btn)
+        layout.addLayout(header)
+
+        # 行高一致时视图不需要逐行测量，滚动到底部时按需索引更多行
+        self.view = QListView()
+        self.view.setUniformItemSizes(True)
+        self.view.setSelectionMode(QListView.ContiguousSelection)
+        self.view.setFont(QFont("Consolas", 12))
+        self.view.setModel(self.model)
+        layout.addWidget(self.view)
+
+    def edit_selection(self):
+        rows = sorted(index.row() for index in self.view.selectionModel().selectedIndexes())
+        if not rows:
+            QMessageBox.information(self, '提示', '请先选中要编辑的行')
+            return
+        first, last = rows[0], rows[-1]
+        try:
+            text = self.model.region_text(first, last)
+        except UnicodeDecodeError:
+            QMessageBox.warning(self, '警告', '所选区域不是有效的UTF-8文本，无法编辑')
+            return
+        dialog = LargeFileRegionDialog(text, first, last, self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        new_text = dialog.editor.text_snapshot()
+        if new_text == text:
+            return
+        try:
+            self.model.write_region(first, last, new_text)
+        except Exception as e:
+            QMessageBox.critical(self, '错误', f'无法写回文件: {str(e)}')
+            return
+        self.model.ensure_rows(first + 1)
+        self.view.scrollTo(self.model.index(first))
 
 class ScratchWebEditor(QMainWindow):
     def __init__(self):
         super().__init__()
         self.file_path = None
+        # 热重载状态：预览页当前对应的 (html, css, js) 源码，以及页面是否加载完成
+        self.hot_reload_enabled = True
+        self._preview_sources = None
+        self._preview_loaded = False
+        self._preview_js_stale = False
+        # 「运行预览」「刷新预览」请求完整加载，不走热重载也不因内容未变而跳过
+        self._force_full_render = False
+        # 预览和保存共用的文档组装器
+        self.document_assembler = DocumentAssembler()
+        self.render_memo = PreviewRenderMemo()
+        self.preview_store = PreviewResourceStore()
+        # 后台组装：单线程池保证按顺序组装，代数计数器丢弃过期结果
+        self.preview_thread_pool = QThreadPool(self)
+        self.preview_thread_pool.setMaxThreadCount(1)
+        self._preview_generation = 0
+        self._preview_assembly_signals = PreviewAssemblySignals(self)
+        self._preview_assembly_signals.finished.connect(self._apply_preview_assembly)
+        # 预览延迟监控：记录编辑、组装、加载各阶段耗时
+        self.latency_monitor = PreviewLatencyMonitor(parent=self)
+        self._loading_timing = None
+        # 延迟启动的预览引擎：创建前组装好的结果先暂存
+        self._preview_engine_scheduled = False
+        self._preview_engine_started = None
+        self._pending_preview_result = None
+        # 多视口预览面板在首次开启时创建
+        self.responsive_panel = None
+        self._responsive_enabled = False
+        # 后台文件加载：加载期间暂停预览，过期的加载结果按代数丢弃
+        self.file_load_pool = QThreadPool(self)
+        self.file_load_pool.setMaxThreadCount(1)
+        self._file_load_generation = 0
+        self._file_load_task = None
+        self._file_load_backup = None
+        self._file_load_queue = deque()  # 已解码、尚未追加到编辑器的文本
+        self._file_load_error = None  # 读取结束后为错误信息（成功时为空字符串）
+        self.file_feed_timer = QTimer(self)
+        self.file_feed_timer.setInterval(0)
+        self.file_feed_timer.timeout.connect(self._feed_file_batch)
+        self._file_load_signals = FileLoadSignals(self)
+        self._file_load_signals.chunk.connect(self._on_file_chunk)
+        self._file_load_signals.progress.connect(self._on_file_progress)
+        self._file_load_signals.finished.connect(self._on_file_loaded)
         self.initUI()
         
 
@@ -2388,6 +4095,7 @@ class ScratchWebEditor(QMainWindow):
         
         # 创建标签页
         tab_widget = QTabWidget()
+        self.main_tabs = tab_widget
         
         # 可视化编程标签
         visual_tab = QWidget()
@@ -2412,10 +4120,12 @@ class ScratchWebEditor(QMainWindow):
         
         # 创建代码编辑标签页
         code_editor_tab = QTabWidget()
+        self.code_editor_tab = code_editor_tab
         
-        self.html_editor = CodeEditor()
-        self.css_editor = CodeEditor()
-        self.js_editor = CodeEditor()
+        self.html_editor = CodeEditor('html')
+        self.css_editor = CodeEditor('css')
+        self.js_editor = CodeEditor('js')
+        self.code_generator = BlockCodeGenerator(self.html_editor, self.css_editor, self.js_editor)
         
         # 设置默认内容
         self.html_editor.setPlainText('<!DOCTYPE html>\n<html>\n<head>\n    <meta charset="UTF-8">\n    <meta name="viewport" content="width=device-width, initial-scale=1.0">\n    <title>我的积木式网页</title>\n    <style>\n        /* CSS样式将自动生成 */\n    </style>\n</head>\n<body>\n    <!-- HTML内容将自动生成 -->\n    <script>\n        // JavaScript代码将自动生成\n    </script>\n</body>\n</html>')
@@ -2445,20 +4155,44 @@ class ScratchWebEditor(QMainWindow):
         preview_toolbar_layout = QHBoxLayout(preview_toolbar)
         
         refresh_btn = QPushButton('刷新预览')
-        refresh_btn.clicked.connect(self.update_preview)
+        refresh_btn.clicked.connect(self.run_preview)
+        
+        # 热重载：只改CSS时直接替换样式，不重新加载页面
+        hot_reload_check = QCheckBox('热重载')
+        hot_reload_check.setToolTip('只修改CSS时直接替换样式，JS修改需手动重新运行')
+        hot_reload_check.setChecked(self.hot_reload_enabled)
+        hot_reload_check.toggled.connect(self.set_hot_reload_enabled)
+        
+        rerun_js_btn = QPushButton('重新运行JS')
+        rerun_js_btn.setToolTip('在新的作用域中执行当前JS代码，不重新加载页面')
+        rerun_js_btn.clicked.connect(self.rerun_preview_js)
+        
+        # 多视口：同时查看多个断点宽度下的页面，预览引擎启动后可用
+        self.responsive_check = QCheckBox('多视口')
+        self.responsive_check.setToolTip('同时以 ' + ' / '.join(f'{w}px' for w in PREVIEW_VIEWPORT_WIDTHS) + ' 宽度预览')
+        self.responsive_check.setEnabled(False)
+        self.responsive_check.toggled.connect(self.set_responsive_preview)
         
         preview_label = QLabel('预览窗口')
         preview_label.setStyleSheet(f"color: {Theme.PRIMARY.name()}; font-weight: bold;")
         
         preview_toolbar_layout.addWidget(preview_label)
         preview_toolbar_layout.addStretch()
+        preview_toolbar_layout.addWidget(self.responsive_check)
+        preview_toolbar_layout.addWidget(hot_reload_check)
+        preview_toolbar_layout.addWidget(rerun_js_btn)
         preview_toolbar_layout.addWidget(refresh_btn)
         
-        # 预览窗口
-        self.preview_widget = QWebEngineView()
+        # 预览窗口：WebEngine在窗口首次绘制后才创建，之前显示占位提示
+        self.preview_widget = None
+        self.preview_stack = QStackedWidget()
+        self.preview_placeholder = QLabel('预览引擎启动中...')
+        self.preview_placeholder.setAlignment(Qt.AlignCenter)
+        self.preview_placeholder.setStyleSheet(f"color: {Theme.TEXT_SECONDARY.name()}; font-size: 16px;")
+        self.preview_stack.addWidget(self.preview_placeholder)
         
         right_layout.addWidget(preview_toolbar)
-        right_layout.addWidget(self.preview_widget)
+        right_layout.addWidget(self.preview_stack)
         
         # 将左侧和右侧添加到主分割器
         main_splitter.addWidget(left_widget)
@@ -2474,13 +4208,30 @@ class ScratchWebEditor(QMainWindow):
         self.statusBar.setStyleSheet(f"background-color: {Theme.SURFACE.name()}; color: {Theme.TEXT.name()};")
         self.statusBar.showMessage('就绪 - 开始拖拽积木来创建你的网页吧！')
         
+        # 文件加载进度
+        self.load_progress = QProgressBar()
+        self.load_progress.setMaximumWidth(200)
+        self.load_progress.setTextVisible(False)
+        self.load_progress.hide()
+        self.statusBar.addPermanentWidget(self.load_progress)
+        
+        # 预览性能面板（可停靠，默认隐藏）
+        self.latency_panel = PreviewLatencyPanel(self.latency_monitor, self)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.latency_panel)
+        self.latency_panel.hide()
+        self.main_toolbar.addAction(self.latency_panel.toggleViewAction())
+        
+        # 预览调度器：编辑器的变更通知先合并，再统一渲染
+        self.preview_scheduler = PreviewScheduler(parent=self)
+        self.preview_scheduler.triggered.connect(self.update_preview)
+        
         # 连接信号
-        self.html_editor.textChanged.connect(self.update_preview)
-        self.css_editor.textChanged.connect(self.update_preview)
-        self.js_editor.textChanged.connect(self.update_preview)
+        self.html_editor.text_delta.connect(self._on_source_edited)
+        self.css_editor.text_delta.connect(self._on_source_edited)
+        self.js_editor.text_delta.connect(self._on_source_edited)
         
         # 初始更新预览
-        self.update_preview()
+        self.render_preview_now()
     
     def create_toolbar(self):
         # 创建工具栏
@@ -2491,6 +4242,7 @@ class ScratchWebEditor(QMainWindow):
         toolbar.setStyleSheet(toolbar.styleSheet() + f" QToolBar::item:selected, QToolBar::item:pressed {{ background-color: {Theme.SECONDARY.name()}; }}")
         toolbar.setStyleSheet(toolbar.styleSheet() + f" QToolButton {{ color: {Theme.BACKGROUND.name()}; font-weight: bold; padding: 6px 14px; border-radius: 4px; }}")
         self.addToolBar(toolbar)
+        self.main_toolbar = toolbar
         
         # 创建新文件按钮
         new_action = QAction("新建项目", self)
@@ -2516,7 +4268,7 @@ class ScratchWebEditor(QMainWindow):
         # 创建运行预览按钮
         run_action = QAction("运行预览", self)
         run_action.setToolTip("更新预览窗口")
-        run_action.triggered.connect(self.update_preview)
+        run_action.triggered.connect(self.run_preview)
         toolbar.addAction(run_action)
     
     def create_block_palette(self, parent_widget):
@@ -2586,97 +4338,244 @@ class ScratchWebEditor(QMainWindow):
         parent_widget.addWidget(palette_tabs)
     
     def update_code_from_blocks(self):
-        # 从积木编辑区生成代码
-        html_code = []
-        css_code = []
-        js_code = []
-        
-        for i in range(self.block_editor.count()):
-            item = self.block_editor.item(i)
-            code = item.code_template
-            
-            # 根据积木类型分类代码
-            if code.strip().startswith('<'):
-                html_code.append(code)
-            elif '{' in code and '}' in code:
-                css_code.append(code)
-            else:
-                js_code.append(code)
+        # 从积木编辑区生成代码：只重新生成有改动的积木，只改写变化的片段范围
+        self.latency_monitor.mark_codegen_start()
+        self.code_generator.update(self.block_editor.records())
         
-        # 更新编辑器内容
-        self.update_merged_code(html_code, css_code, js_code)
+        # 更新编辑器内容（随后的预览渲染会在状态栏显示是否跳过）
         self.statusBar.showMessage('已从积木更新代码')
+        # 三个编辑器的变更已排队，这里合并为一次渲染
+        self.render_preview_now()
     
-    def update_merged_code(self, html_parts, css_parts, js_parts):
-        # 获取当前HTML内容
-        html = self.html_editor.toPlainText()
-        
-        # 合并HTML部分
-        if html_parts:
-            body_start = html.find('<body>')
-            body_end = html.find('</body>')
-            if body_start != -1 and body_end != -1:
-                # 保留原有的body内容，添加新内容
-                body_content = '\n    ' + '\n    '.join(html_parts) + '\n'
-                new_html = html[:body_start + 6] + body_content + html[body_end:]
-                self.html_editor.setPlainText(new_html)
-        
-        # 合并CSS部分
-        if css_parts:
-            css = self.css_editor.toPlainText()
-            # 添加新的CSS规则
-            for css_part in css_parts:
-                if css_part not in css:
-                    css += '\n\n' + css_part
-            self.css_editor.setPlainText(css)
-        
-        # 合并JS部分
-        if js_parts:
-            js = self.js_editor.toPlainText()
-            dom_content = "document.addEventListener(\"DOMContentLoaded\", function() {"
-            # 查找DOMContentLoaded事件处理函数
-            if dom_content in js:
-                # 在DOMContentLoaded函数内添加代码
-                start = js.find(dom_content) + len(dom_content)
-                end = js.rfind("});")
-                if start != -1 and end != -1:
-                    new_js_code = '\n    ' + '\n    '.join(js_parts) + '\n'
-                    new_js = js[:start] + new_js_code + js[end:]
-                    self.js_editor.setPlainText(new_js)
-        
-        # 更新预览
-        self.update_preview()
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.preview_widget is None and not self._preview_engine_scheduled:
+            # 等中央部件第一次真正绘制后再创建WebEngine，窗口先可用，渲染进程随后启动
+            self._preview_engine_scheduled = True
+            self.centralWidget().installEventFilter(self)
     
-    def update_preview(self):
-        # 更新预览窗口
-        html = self.html_editor.toPlainText()
-        css = self.css_editor.toPlainText()
-        js = self.js_editor.toPlainText()
-        
-        # 合并HTML、CSS和JS
-        if '<style>' in html and '</style>' in html:
-            start = html.find('<style>')
-            end = html.find('</style>')
-            html = html[:start + 7] + '\n' + css + '\n' + html[end:]
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint and obj is self.centralWidget():
+            # 只等一次；排到本次绘制完成之后
+            obj.removeEventFilter(self)
+            QTimer.singleShot(0, self._init_preview_engine)
+        return super().eventFilter(obj, event)
+    
+    def _init_preview_engine(self):
+        """创建预览用的WebEngine视图和配置，并应用启动期间已组装好的文档"""
+        started = time.perf_counter()
+        self.preview_widget = QWebEngineView()
+        if preview_scheme_registered():
+            # 独立的内存配置，预览协议处理器只服务于本窗口的资源
+            self.preview_profile = QWebEngineProfile(QApplication.instance())
+            self.preview_scheme_handler = PreviewSchemeHandler(self.preview_store, self.preview_profile)
+            self.preview_profile.installUrlSchemeHandler(PREVIEW_SCHEME, self.preview_scheme_handler)
+            self.preview_widget.setPage(QWebEnginePage(self.preview_profile, self.preview_widget))
+        self.preview_widget.loadStarted.connect(self._on_preview_load_started)
+        self.preview_widget.loadFinished.connect(self._on_preview_load_finished)
+        self.preview_stack.addWidget(self.preview_widget)
+        self._preview_engine_started = started
+        self.responsive_check.setEnabled(True)
+        
+        pending, self._pending_preview_result = self._pending_preview_result, None
+        if pending is not None and pending.generation == self._preview_generation:
+            self._apply_preview_assembly(pending)
         else:
-            if '<head>' in html:
-                html = html.replace('<head>', f'<head>\n    <style>\n{css}\n    </style>')
-            else:
-                html = '<!DOCTYPE html>\n<html>\n<head>\n    <meta charset="UTF-8">\n    <style>\n' + css + '\n    </style>\n</head>\n<body>\n' + \
-                       html[html.find('<body>') + 6:html.rfind('</body>')] + '\n</body>\n</html>'
-        
-        if '<script>' in html and '</script>' in html:
-            start = html.rfind('<script>')
-            end = html.rfind('</script>')
-            if start != -1 and end != -1:
-                html = html[:start + 8] + '\n' + js + '\n' + html[end:]
+            self.render_preview_now()
+    
+    def set_responsive_preview(self, enabled):
+        """切换多视口预览；单视图隐藏期间不再渲染，切回时完整加载一次"""
+        self._responsive_enabled = enabled
+        if enabled:
+            if self.responsive_panel is None:
+                self.responsive_panel = ResponsivePreviewPanel(
+                    self.preview_store, getattr(self, 'preview_profile', None))
+                self.preview_stack.addWidget(self.responsive_panel)
+            self.preview_stack.setCurrentWidget(self.responsive_panel)
+            self.statusBar.showMessage('已开启多视口预览')
         else:
-            if '</body>' in html:
-                html = html.replace('</body>', f'    <script>\n{js}\n    </script>\n</body>')
+            self.preview_stack.setCurrentWidget(self.preview_widget)
+            self.statusBar.showMessage('已关闭多视口预览')
+        # 两种模式共用同一次组装，切换后重新渲染当前内容
+        self._preview_sources = None
+        self._preview_loaded = False
+        self.render_memo.forget()
+        self.render_preview_now()
+    
+    def _on_source_edited(self, revision, position, removed, inserted):
+        if self._file_load_task is not None:
+            return  # 文件加载完成后统一渲染
+        self.latency_monitor.mark_edit()
+        self.preview_scheduler.schedule()
+    
+    def render_preview_now(self):
+        """绕过防抖，立即渲染预览"""
+        self.preview_scheduler.flush()
+    
+    def run_preview(self):
+        """手动运行预览：完整重新加载页面，修改过的JS也会执行"""
+        self._force_full_render = True
+        self.render_preview_now()
+    
+    def set_hot_reload_enabled(self, enabled):
+        self.hot_reload_enabled = enabled
+        if not enabled:
+            # 关闭热重载后立即完整渲染一次，保证预览与代码一致
+            self.render_preview_now()
+    
+    def _on_preview_load_started(self):
+        if self._loading_timing is not None:
+            self._loading_timing['load_started'] = time.perf_counter()
+    
+    def _on_preview_load_finished(self, ok):
+        self._preview_loaded = ok
+        if not ok:
+            self.render_memo.forget()
+        if self.preview_stack.indexOf(self.preview_placeholder) != -1:
+            # 首次渲染完成，移除占位提示
+            if self.preview_stack.currentWidget() is self.preview_placeholder:
+                self.preview_stack.setCurrentWidget(self.preview_widget)
+            self.preview_stack.removeWidget(self.preview_placeholder)
+            elapsed = (time.perf_counter() - self._preview_engine_started) * 1000
+            self.statusBar.showMessage(f'预览引擎就绪（启动耗时 {elapsed:.0f} ms）')
+        timing, self._loading_timing = self._loading_timing, None
+        if timing is None:
+            return
+        timing['load_finished'] = time.perf_counter()
+        if ok:
+            # 读取页面的导航计时，区分HTML解析和用户脚本耗时
+            self.preview_widget.page().runJavaScript(
+                NAVIGATION_TIMING_SCRIPT,
+                lambda values: self.latency_monitor.finish_render(
+                    timing, 'full', *(values if isinstance(values, list) and len(values) == 2 else ())))
+        else:
+            self.latency_monitor.finish_render(timing, 'failed')
+    
+    def _can_hot_reload(self, result):
+        """页面已加载完成且<head>等外壳未变时，才能只注入CSS/JS或给body打补丁"""
+        if not (self.hot_reload_enabled and self._preview_loaded
+                and self._preview_sources is not None):
+            return False
+        # 组装期间预览页已换成别的内容时，外壳比较结果作废
+        if result.rendered_html is not self._preview_sources[0]:
+            return False
+        return result.html_unchanged or result.body is not None
+    
+    def _on_dom_patch_finished(self, timing, ok):
+        """补丁失败（如新增了<script>）时回退到完整加载"""
+        if ok is True:
+            self.latency_monitor.finish_render(timing, 'patch')
+        else:
+            self._preview_sources = None
+            self.render_memo.forget()
+            self.render_preview_now()
+    
+    def rerun_preview_js(self):
+        """在新的函数作用域中重新执行JS代码"""
+        if self._responsive_enabled:
+            self.responsive_panel.reload_all()
+            return
+        if not self._preview_loaded or self._preview_sources is None:
+            self.render_preview_now()
+            return
+        js = self.js_editor.text_snapshot()
+        self.preview_widget.page().runJavaScript(HOT_JS_SCRIPT % json.dumps(js))
+        html, css, _ = self._preview_sources
+        self._preview_sources = (html, css, js)
+        self._preview_js_stale = False
+        self.render_memo.remember(self._preview_sources)
+        self.statusBar.showMessage('已在新作用域中重新运行JS')
+    
+    def update_preview(self):
+        # 更新预览窗口：GUI线程只取快照，组装在线程池中完成
+        html = self.html_editor.text_snapshot()
+        css = self.css_editor.text_snapshot()
+        js = self.js_editor.text_snapshot()
+        sources = (html, css, js)
+        
+        # 先递增代数，使组装中的旧请求作废（例如改动后又撤销回预览当前显示的内容）
+        self._preview_generation += 1
+        
+        # 内容与预览当前显示的完全相同时不再渲染（手动运行预览除外）
+        force_full, self._force_full_render = self._force_full_render, False
+        if not force_full and self.render_memo.is_current(sources):
+            self.latency_monitor.discard_edit()
+            self.statusBar.showMessage(f'预览内容未变化，已跳过渲染（累计跳过 {self.render_memo.skipped} 次）')
+            return
+        
+        rendered_html = self._preview_sources[0] if self._preview_sources is not None else None
+        result = PreviewAssembly(self._preview_generation, sources, rendered_html)
+        result.force_full = force_full
+        result.timing = self.latency_monitor.begin_render()
+        self.preview_thread_pool.start(PreviewAssemblyTask(
+            result, self.document_assembler, self._preview_assembly_signals,
+            encode=preview_scheme_registered()))
+    
+    def _apply_preview_assembly(self, result):
+        """在GUI线程中应用组装结果：DOM补丁、样式热替换或完整加载"""
+        if result.generation != self._preview_generation:
+            return  # 已有更新的渲染请求，丢弃过期结果
+        if self.preview_widget is None:
+            self._pending_preview_result = result  # 预览引擎尚未创建
+            return
+        html, css, js = result.sources
+        timing = result.timing
+        timing['assembly'] = result.assembly_ms
+        timing['applied'] = time.perf_counter()
+        
+        if self._responsive_enabled:
+            self.render_memo.remember(result.sources)
+            self.responsive_panel.show_result(result)
+            self.latency_monitor.finish_render(timing, 'responsive')
+            pending = self.responsive_panel.stale_count()
+            suffix = f'，{pending} 个视口将在空闲时刷新' if pending else ''
+            self.statusBar.showMessage(f'多视口预览已更新{suffix}')
+            return
+        
+        # 外壳未变时：热替换CSS，body差异以DOM补丁应用，JS修改只标记，等待手动重新运行
+        if not result.force_full and self._can_hot_reload(result):
+            _, rendered_css, rendered_js = self._preview_sources
+            if css != rendered_css:
+                self.preview_widget.page().runJavaScript(
+                    HOT_CSS_SCRIPT % json.dumps(css),
+                    (lambda _: None) if result.body is not None else
+                    (lambda _: self.latency_monitor.finish_render(timing, 'css')))
+            if result.body is not None:
+                self.preview_widget.page().runJavaScript(
+                    DOM_PATCH_SCRIPT % json.dumps(result.body),
+                    lambda ok: self._on_dom_patch_finished(timing, ok))
+            if result.body is None and css == rendered_css:
+                self.latency_monitor.finish_render(timing, 'hot')
+            if js != rendered_js:
+                self._preview_js_stale = True
+            self._preview_sources = (html, css, rendered_js)
+            self.render_memo.remember(self._preview_sources)
+            if self._preview_js_stale:
+                self.statusBar.showMessage('JS已修改，点击「重新运行JS」执行')
+            elif result.body is not None:
+                self.statusBar.showMessage('预览已更新（DOM补丁）')
+            else:
+                self.statusBar.showMessage('预览已更新（样式热替换）')
+            return
         
         # 设置预览内容
-        self.preview_widget.setHtml(html)
-        self.statusBar.showMessage('预览已更新')
+        self._preview_loaded = False
+        self._preview_sources = result.sources
+        self._preview_js_stale = False
+        self.render_memo.remember(self._preview_sources)
+        self._loading_timing = timing
+        self._show_preview_document(result)
+        self.statusBar.showMessage(f'预览已更新（第 {self.render_memo.rendered} 次渲染）')
+    
+    def _show_preview_document(self, result):
+        """通过预览协议加载文档；协议未注册时退回setHtml"""
+        if not preview_scheme_registered():
+            self.preview_widget.setHtml(result.document)
+            return
+        self.preview_store.publish_data(PREVIEW_DOCUMENT_PATH, result.data, result.etag)
+        url = QUrl(f'{PREVIEW_SCHEME.decode()}://{PREVIEW_HOST}{PREVIEW_DOCUMENT_PATH}')
+        url.setQuery(f'v={result.etag}')
+        self.preview_widget.setUrl(url)
     
     def new_file(self):
         # 新建文件
@@ -2684,11 +4583,14 @@ class ScratchWebEditor(QMainWindow):
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         
         if reply == QMessageBox.Yes:
+            # 正在加载的文件不再追加到新文档
+            self.cancel_file_load()
             self.html_editor.clear()
             self.css_editor.clear()
             self.js_editor.clear()
             self.block_editor.clear()
             self.file_path = None
+            self.preview_store.set_root(None)
             self.setWindowTitle('积木式Web开发工具')
             self.statusBar.showMessage('已创建新文件')
             # 重置默认内容
@@ -2702,36 +4604,154 @@ class ScratchWebEditor(QMainWindow):
         
         if file_path:
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    html_content = f.read()
-                    
-                # 提取HTML内容
-                self.html_editor.setPlainText(html_content)
-                
-                # 提取CSS内容
-                css_start = html_content.find('<style>')
-                css_end = html_content.find('</style>')
-                if css_start != -1 and css_end != -1:
-                    css_content = html_content[css_start + 7:css_end].strip()
-                    self.css_editor.setPlainText(css_content)
-                
-                # 提取JavaScript内容
-                js_start = html_content.find('<script>')
-                js_end = html_content.find('</script>')
-                if js_start != -1 and js_end != -1:
-                    js_content = html_content[js_start + 8:js_end].strip()
-                    self.js_editor.setPlainText(js_content)
-                
-                # 清空积木编辑器
-                self.block_editor.clear()
-                
-                self.file_path = file_path
-                self.setWindowTitle(f'积木式Web开发工具 - {os.path.basename(file_path)}')
-                self.statusBar.showMessage(f'已打开文件: {os.path.basename(file_path)}')
-                self.update_preview()
-            except Exception as e:
+                large = os.path.getsize(file_path) >= LARGE_FILE_THRESHOLD
+            except OSError as e:
                 QMessageBox.critical(self, '错误', f'无法打开文件: {str(e)}')
+                return
+            if large:
+                self.open_large_file(file_path)
+            else:
+                self.load_file(file_path)
+    
+    def open_large_file(self, file_path):
+        """超过阈值的文件以只读方式映射查看，不载入编辑器和预览"""
+        try:
+            viewer = LargeFileViewer(file_path)
+        except Exception as e:
+            QMessageBox.critical(self, '错误', f'无法打开文件: {str(e)}')
+            return
+        viewer.closed.connect(lambda: self._close_large_file(viewer))
+        index = self.code_editor_tab.addTab(viewer, f'只读: {os.path.basename(file_path)}')
+        self.code_editor_tab.setCurrentIndex(index)
+        self.main_tabs.setCurrentIndex(self.main_tabs.indexOf(self.code_editor_tab.parentWidget()))
+        size_mb = os.path.getsize(file_path) / (1024 * 1024)
+        self.statusBar.showMessage(f'已以只读方式打开大文件: {os.path.basename(file_path)}（{size_mb:.1f} MB），选中行后可编辑该区域')
     
+    def _close_large_file(self, viewer):
+        self.code_editor_tab.removeTab(self.code_editor_tab.indexOf(viewer))
+        viewer.model.close()
+        viewer.deleteLater()
+    
+    def load_file(self, file_path):
+        """在后台读取文件，内容分批追加到HTML编辑器，期间窗口保持响应"""
+        if self._file_load_task is not None:
+            self._file_load_task.cancelled = True
+        else:
+            # 加载失败时恢复原内容
+            self._file_load_backup = self.html_editor.text_snapshot()
+        self._file_load_generation += 1
+        self._file_load_queue.clear()
+        self._file_load_error = None
+        # 先登记加载任务再清空编辑器，清空和追加引起的编辑通知都不会触发预览
+        self._file_load_task = FileLoadTask(self._file_load_generation, file_path, self._file_load_signals)
+        self.preview_scheduler.cancel()
+        
+        # 分批追加不记录撤销步骤，和setPlainText一样清空撤销历史；
+        # 加载期间只读，用户输入不会与追加的内容交错
+        self.html_editor.setUndoRedoEnabled(False)
+        self.html_editor.setReadOnly(True)
+        self.html_editor.clear()
+        self.load_progress.setRange(0, 0)
+        self.load_progress.show()
+        self.statusBar.showMessage(f'正在打开文件: {os.path.basename(file_path)}')
+        
+        self.file_load_pool.start(self._file_load_task)
+    
+    def cancel_file_load(self):
+        """放弃正在进行的文件加载，丢弃尚未追加的内容并恢复编辑"""
+        if self._file_load_task is None:
+            return
+        self._file_load_task.cancelled = True
+        self._file_load_task = None
+        self._file_load_generation += 1
+        self._file_load_queue.clear()
+        self._file_load_error = None
+        self._file_load_backup = None
+        self.file_feed_timer.stop()
+        self.load_progress.hide()
+        self.html_editor.setUndoRedoEnabled(True)
+        self.html_editor.setReadOnly(False)
+    
+    def _on_file_chunk(self, generation, text):
+        if generation != self._file_load_generation:
+            return
+        self._file_load_queue.append(text)
+        self.file_feed_timer.start()
+    
+    def _feed_file_batch(self):
+        # 每次定时器触发只追加一帧时间内能完成的若干小批，避免积压的块一次性插入
+        deadline = time.perf_counter() + HIGHLIGHT_FRAME_BUDGET_MS / 1000
+        queue = self._file_load_queue
+        cursor = QTextCursor(self.html_editor.document())
+        while queue and time.perf_counter() < deadline:
+            text = queue.popleft()
+            if len(text) > FILE_FEED_BATCH_CHARS:
+                queue.appendleft(text[FILE_FEED_BATCH_CHARS:])
+                text = text[:FILE_FEED_BATCH_CHARS]
+            cursor.movePosition(QTextCursor.End)
+            cursor.insertText(text)
+        if not queue:
+            self.file_feed_timer.stop()
+            if self._file_load_error is not None:
+                self._finish_file_load()
+    
+    def _on_file_progress(self, generation, read, total):
+        if generation != self._file_load_generation:
+            return
+        # 进度按KB计，避免超过int范围
+        self.load_progress.setRange(0, max(total // 1024, 1))
+        self.load_progress.setValue(read // 1024)
+    
+    def _on_file_loaded(self, generation, error):
+        if generation != self._file_load_generation:
+            return
+        self._file_load_error = error
+        if error:
+            self._file_load_queue.clear()
+            self.file_feed_timer.stop()
+        if not self._file_load_queue:
+            self._finish_file_load()
+    
+    def _finish_file_load(self):
+        error = self._file_load_error
+        file_path = self._file_load_task.file_path
+        self._file_load_task = None
+        self.load_progress.hide()
+        self.html_editor.setUndoRedoEnabled(True)
+        self.html_editor.setReadOnly(False)
+        
+        if error:
+            self.html_editor.setPlainText(self._file_load_backup)
+            self._file_load_backup = None
+            self.statusBar.showMessage('打开文件失败')
+            QMessageBox.critical(self, '错误', f'无法打开文件: {error}')
+            return
+        self._file_load_backup = None
+        html_content = self.html_editor.text_snapshot()
+        
+        # 提取CSS内容
+        css_start = html_content.find('<style>')
+        css_end = html_content.find('</style>')
+        if css_start != -1 and css_end != -1:
+            css_content = html_content[css_start + 7:css_end].strip()
+            self.css_editor.setPlainText(css_content)
+        
+        # 提取JavaScript内容
+        js_start = html_content.find('<script>')
+        js_end = html_content.find('</script>')
+        if js_start != -1 and js_end != -1:
+            js_content = html_content[js_start + 8:js_end].strip()
+            self.js_editor.setPlainText(js_content)
+        
+        # 清空积木编辑器
+        self.block_editor.clear()
+        
+        self.file_path = file_path
+        self.preview_store.set_root(os.path.dirname(file_path))
+        self.setWindowTitle(f'积木式Web开发工具 - {os.path.basename(file_path)}')
+        self.statusBar.showMessage(f'已打开文件: {os.path.basename(file_path)}')
+        self.render_preview_now()
+
     def save_file(self):
         # 保存文件
         if not self.file_path:
@@ -2750,39 +4770,19 @@ class ScratchWebEditor(QMainWindow):
     
     def _save_current_file(self, file_path):
         try:
-            html = self.html_editor.toPlainText()
-            css = self.css_editor.toPlainText()
-            js = self.js_editor.toPlainText()
+            html = self.html_editor.text_snapshot()
+            css = self.css_editor.text_snapshot()
+            js = self.js_editor.text_snapshot()
             
             # 合并HTML、CSS和JS内容
-            if '<style>' in html and '</style>' in html:
-                start = html.find('<style>')
-                end = html.find('</style>')
-                html = html[:start + 7] + '\n' + css + '\n' + html[end:]
-            else:
-                if '<head>' in html:
-                    html = html.replace('<head>', f'<head>\n    <style>\n{css}\n    </style>')
-                else:
-                    html = '<!DOCTYPE html>\n<html>\n<head>\n    <meta charset="UTF-8">\n    <style>\n' + css + '\n    </style>\n</head>\n<body>\n' + \
-                           html[html.find('<body>') + 6:html.rfind('</body>')] + '\n</body>\n</html>'
-            
-            if '<script>' in html and '</script>' in html:
-                start = html.find('<script>')
-                end = html.find('</script>')
-                if start != -1 and end != -1:
-                    html = html[:start + 8] + '\n' + js + '\n' + html[end:]
-            else:
-                if '</body>' in html:
-                    html = html.replace('</body>', f'    <script>\n{js}\n    </script>\n</body>')
-                else:
-                    if '</html>' in html:
-                        html = html.replace('</html>', '</body>\n    <script>\n' + js + '\n    </script>\n</html>')
+            html = self.document_assembler.assemble(html, css, js)
             
             # 保存到文件
             with open(file_path, 'w', encoding='utf-8') as f:
                 f.write(html)
             
             self.file_path = file_path
+            self.preview_store.set_root(os.path.dirname(file_path))
             self.setWindowTitle(f'积木式Web开发工具 - {os.path.basename(file_path)}')
             self.statusBar.showMessage(f'已保存文件: {os.path.basename(file_path)}')
         except Exception as e:
@@ -2790,6 +4790,7 @@ class ScratchWebEditor(QMainWindow):
 
 if __name__ == '__main__':
     # 确保应用程序可以正常运行
+    register_preview_scheme()  # 自定义协议必须在QApplication之前注册
     app = QApplication(sys.argv)
     app.setStyle("Fusion")  # 使用Fusion样式以获得更好的跨平台一致性
     editor = ScratchWebEditor()